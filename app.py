@@ -1,41 +1,378 @@
-from flask import Flask, render_template, send_from_directory, jsonify, request
+from flask import Flask, render_template, send_from_directory, jsonify, request, has_request_context, g, redirect, url_for
+from flask.logging import default_handler
+from flask.wrappers import Response
 import os
 import json
 import re
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
+import atexit
+import time
 import traceback
+import threading
+import hashlib
+import html
+import io
+import stat
+import bisect
+import heapq
+import math
+import gzip
+import zlib
+import mimetypes
+from collections import OrderedDict
+from datetime import datetime, timezone
+import click
+from dirwatch import DirectoryWatcher
+import cache
+import metrics
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+from jinja2 import FileSystemBytecodeCache
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('app.log')
-    ]
-)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Minifiers for asset bundles; without them bundles are only concatenated
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+# Logging. In 'async' mode records are handed to a queue and written to the
+# console and log file by a background thread, so request threads never wait
+# on disk I/O; 'sync' writes from the calling thread as before.
+LOG_MODE = os.environ.get('LOG_MODE', 'async')
+LOG_FILE = os.environ.get('LOG_FILE', 'app.log')
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Size-based rotation of LOG_FILE; LOG_MAX_BYTES=0 turns it off
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '5'))
+# Thinning of hot, low-value INFO/DEBUG lines per endpoint (the Flask
+# endpoint name, e.g. static, get_file, serve_data_file):
+#   LOG_SAMPLING="static=0.1"      keep 1 in 10 lines
+#   LOG_RATE_LIMITS="static=20"    keep at most 20 lines per second
+LOG_SAMPLING = os.environ.get('LOG_SAMPLING', '')
+LOG_RATE_LIMITS = os.environ.get('LOG_RATE_LIMITS', '')
+
+def parse_log_rules(spec):
+    """Parse "endpoint=number,..." into a dict"""
+    rules = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        endpoint, _, value = item.partition('=')
+        rules[endpoint.strip()] = float(value)
+    return rules
+
+class SamplingFilter(logging.Filter):
+    """Drop a share of INFO/DEBUG records per endpoint.
+
+    The endpoint is taken from the current request, or for werkzeug access
+    lines from the request line being logged. Warnings and errors always
+    pass. sampling maps endpoints to the fraction of records kept and
+    rate_limits to the most records kept per second.
+    """
+
+    def __init__(self, sampling=None, rate_limits=None):
+        super().__init__()
+        self.sampling = sampling or {}
+        self.rate_limits = rate_limits or {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._credit = {}
+        self._buckets = {}
+
+    def endpoint(self, record):
+        if has_request_context():
+            return request.endpoint
+        if record.name == 'werkzeug' and isinstance(record.args, tuple) and record.args:
+            # Access lines are logged as '"%s" %s %s' % (request line, status, size)
+            parts = str(record.args[0]).split(' ')
+            if len(parts) == 3:
+                try:
+                    return app.url_map.bind('localhost').match(parts[1].split('?')[0], method=parts[0])[0]
+                except HTTPException:
+                    return None
+        return None
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not (self.sampling or self.rate_limits):
+            return True
+        # With several handlers in sync mode, decide once per record
+        keep = getattr(record, 'sampled', None)
+        if keep is None:
+            keep = record.sampled = self._keep(self.endpoint(record))
+        return keep
+
+    def _keep(self, endpoint):
+        rate = self.sampling.get(endpoint)
+        limit = self.rate_limits.get(endpoint)
+        if rate is None and limit is None:
+            return True
+        with self._lock:
+            if rate is not None:
+                # Deterministic 1-in-N: keep a record each time a whole credit accrues
+                credit = self._credit.get(endpoint, 0.0) + rate
+                if credit < 1:
+                    self._credit[endpoint] = credit
+                    self.dropped += 1
+                    return False
+                self._credit[endpoint] = credit - 1
+            if limit is not None:
+                # Token bucket refilled at `limit` records per second
+                now = time.monotonic()
+                tokens, updated = self._buckets.get(endpoint, (limit, now))
+                tokens = min(limit, tokens + (now - updated) * limit)
+                if tokens < 1:
+                    self._buckets[endpoint] = (tokens, now)
+                    self.dropped += 1
+                    return False
+                self._buckets[endpoint] = (tokens - 1, now)
+        return True
+
+log_listener = None
+
+def configure_logging(mode=None, filename=None, console=True, sampling=None, rate_limits=None):
+    """Install the root log handlers; safe to call again to switch modes.
+
+    mode is 'async', 'sync' or 'off' (warnings and errors only, console).
+    Anything not given comes from the LOG_* settings in app.config.
+    Returns the SamplingFilter in use.
+    """
+    global log_listener
+    config = app.config
+    mode = config['LOG_MODE'] if mode is None else mode
+    filename = config['LOG_FILE'] if filename is None else filename
+    root = logging.getLogger()
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+    # Flask gives the app logger its own stderr handler when nothing is
+    # configured yet; the root handlers replace it
+    logger.removeHandler(default_handler)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    sampler = SamplingFilter(parse_log_rules(config['LOG_SAMPLING']) if sampling is None else sampling,
+                             parse_log_rules(config['LOG_RATE_LIMITS']) if rate_limits is None else rate_limits)
+    handlers = []
+    if console:
+        handlers.append(logging.StreamHandler())
+    if mode != 'off' and filename:
+        if config['LOG_MAX_BYTES'] > 0:
+            handlers.append(RotatingFileHandler(filename, maxBytes=config['LOG_MAX_BYTES'],
+                                                backupCount=config['LOG_BACKUP_COUNT']))
+        else:
+            handlers.append(logging.FileHandler(filename))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if mode == 'async':
+        queue_handler = QueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(sampler)
+        log_listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        log_listener.start()
+        root.addHandler(queue_handler)
+    else:
+        for handler in handlers:
+            handler.addFilter(sampler)
+            root.addHandler(handler)
+    root.setLevel(logging.WARNING if mode == 'off' else logging.INFO)
+    return sampler
+
+def stop_logging():
+    """Flush queued records and stop the background writer"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+def restart_logging_after_fork():
+    """Give a forked worker its own log queue and writer thread (threads do not survive fork)"""
+    global log_listener
+    if log_listener is None:
+        return
+    fresh = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue = fresh
+    log_listener = QueueListener(fresh, *log_listener.handlers, respect_handler_level=True)
+    log_listener.start()
+
+atexit.register(stop_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=restart_logging_after_fork)
+
+# Read size for ranges that cannot use sendfile
+FILE_RANGE_BUFFER_SIZE = 64 * 1024
 
-app = Flask(__name__, static_folder='static', template_folder='templates')
+class FileRange:
+    """The bytes [start, start + length) of an open file, as a file object.
+
+    Reads stop at the end of the range, so a server iterating the
+    wsgi.file_wrapper (or asgi.py reading it in chunks) sends exactly the
+    range. fileno() is only offered for ranges that start at byte 0:
+    gunicorn 20.1 hands the descriptor to sendfile from offset 0, bounded by
+    Content-Length, so only those ranges can be sent zero-copy.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.start = start
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        if self.start:
+            raise io.UnsupportedOperation('fileno')
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+class FileResponse(Response):
+    """Response whose 206 file bodies stay in wsgi.file_wrapper.
+
+    Werkzeug answers Range requests by wrapping the body in an iterator
+    that reads the file through Python, which hides it from sendfile and
+    from asgi.py. Here the file itself is rewrapped as a FileRange.
+    """
+
+    def _wrap_range_response(self, start, length):
+        file = getattr(self.response, 'file', None) or getattr(self.response, 'filelike', None)
+        if self.status_code != 206 or file is None or not has_request_context():
+            return super()._wrap_range_response(start, length)
+        self.response = wrap_file(request.environ, FileRange(file, start, length), FILE_RANGE_BUFFER_SIZE)
+
+    def make_conditional(self, request_or_environ, accept_ranges=False, complete_length=None):
+        # Werkzeug only sends Accept-Ranges on 206s; advertise it on full
+        # responses too, so clients know a download can be resumed
+        super().make_conditional(request_or_environ, accept_ranges, complete_length)
+        if accept_ranges and self.status_code == 200:
+            self.accept_ranges = 'bytes'
+        return self
+
+# serve_static() below handles /static itself (precompressed variants), so
+# Flask's built-in static route is disabled. File routes answer Range and
+# If-Range with 206 through FileResponse.
+app = Flask(__name__, static_folder=None, template_folder='templates')
+app.response_class = FileResponse
 logger = app.logger
 
-# Root directory containing all our files
+# Root directory containing all our files. create_app() can point these
+# elsewhere (in app.config); nothing is read or created until it (or a
+# request) runs.
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
 
-# Log important directory paths on startup
-logger.info(f"BASE_DIR: {BASE_DIR}")
-logger.info(f"DATA_DIR: {DATA_DIR}")
-logger.info(f"STATIC_DIR: {STATIC_DIR}")
-logger.info(f"TEMPLATE_DIR: {TEMPLATE_DIR}")
+# Where the overview markdown is turned into HTML: 'client' (markdown-renderer.js)
+# or 'server' (/api/markdown?format=html)
+MARKDOWN_RENDER_MODE = os.environ.get('MARKDOWN_RENDER_MODE', 'client')
+MARKDOWN_FORMATS = ('markdown', 'html')
 
-# Ensure the data directory exists
-try:
-    os.makedirs(DATA_DIR, exist_ok=True)
-    logger.info(f"DATA_DIR exists or was created: {DATA_DIR}")
-except Exception as e:
-    logger.error(f"Failed to create DATA_DIR: {str(e)}")
+# Every .md file below DATA_DIR is a document, named by its path without
+# the extension (/api/markdown/docs/<doc>, ?doc=<doc>). DEFAULT_DOCUMENT is the
+# one shown on the index page and served when no document is named. Parsed
+# documents are kept in an LRU holding at most DOCUMENT_CACHE_MAX_BYTES of
+# source and processed text.
+DEFAULT_DOCUMENT = os.environ.get('DEFAULT_DOCUMENT', 'ai-first')
+MARKDOWN_EXTENSION = '.md'
+DOCUMENT_CACHE_MAX_BYTES = int(os.environ.get('DOCUMENT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# /api/markdown/stream sends the document as NDJSON, one record per section,
+# reading the file as it goes. Sections with more content than this are
+# split over several records, so memory stays flat for any document size.
+STREAM_RECORD_SIZE = 64 * 1024
+
+# How the data manifest notices changes in DATA_DIR: 'auto' (inotify where
+# available, else polling), 'inotify' or 'poll'
+DATA_WATCH_MODE = os.environ.get('DATA_WATCH_MODE', 'auto')
+DATA_WATCH_POLL_INTERVAL = float(os.environ.get('DATA_WATCH_POLL_INTERVAL', '2'))
+
+# Base names of the workflow diagrams shown in the portal; each may exist
+# as .mermaid or .txt
+DIAGRAM_BASE_NAMES = ['traditional-workflow', 'ai-assisted-workflow', 'ai-first-workflow']
+MAX_BUNDLE_DIAGRAMS = 50
+
+# Directory shared by all worker processes for /metrics; unset means
+# in-memory metrics for a single process
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+
+# Where encoded API responses are kept (see cache.py): 'memory' (an LRU in
+# each process), 'shm' (shared by the workers of this host, in CACHE_DIR,
+# default under /dev/shm) or 'redis' (shared by every host, at CACHE_URL).
+# Entries expire after CACHE_TTL seconds (0 for never); the memory and shm
+# stores hold at most CACHE_MAX_BYTES. All of them are invalidated when
+# files in DATA_DIR change.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_DIR = os.environ.get('CACHE_DIR') or None
+CACHE_URL = os.environ.get('CACHE_URL', 'redis://localhost:6379/0')
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '3600'))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Build every cache in create_app(), before the first request is accepted
+WARM_UP = os.environ.get('WARM_UP', '1') != '0'
+
+# Jinja's bytecode cache: compiled templates are stored on disk, so a new
+# process loads them instead of compiling. Unset uses a per-user directory
+# in the system temp dir; 'off' disables it.
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR') or None
+
+# Whether pages link one bundle per entry of ASSET_BUNDLES instead of the
+# separate files: 'on', 'off', or 'auto' (bundle unless in debug mode)
+BUNDLE_ASSETS = os.environ.get('BUNDLE_ASSETS', 'auto')
+
+# Settings create_app(config) accepts; each defaults to the module-level
+# value of the same name above. Code reads them from app.config, which
+# starts out with these defaults.
+CONFIG_KEYS = ('BASE_DIR', 'DATA_DIR', 'STATIC_DIR', 'TEMPLATE_DIR', 'MARKDOWN_RENDER_MODE',
+               'DEFAULT_DOCUMENT', 'DOCUMENT_CACHE_MAX_BYTES',
+               'DATA_WATCH_MODE', 'DATA_WATCH_POLL_INTERVAL', 'METRICS_DIR', 'WARM_UP', 'BUNDLE_ASSETS',
+               'TEMPLATE_CACHE_DIR', 'CACHE_BACKEND', 'CACHE_DIR', 'CACHE_URL', 'CACHE_TTL', 'CACHE_MAX_BYTES',
+               'LOG_MODE', 'LOG_FILE', 'LOG_MAX_BYTES', 'LOG_BACKUP_COUNT', 'LOG_SAMPLING', 'LOG_RATE_LIMITS')
+# Values allowed for the settings that name a mode
+CONFIG_CHOICES = {
+    'MARKDOWN_RENDER_MODE': ('client', 'server'),
+    'DATA_WATCH_MODE': ('auto', 'inotify', 'poll'),
+    'BUNDLE_ASSETS': ('auto', 'on', 'off'),
+    'CACHE_BACKEND': cache.BACKENDS,
+    'LOG_MODE': ('async', 'sync', 'off'),
+}
+app.config.update({key: globals()[key] for key in CONFIG_KEYS})
+# The settings create_app() was called with; the app and its caches are
+# module-level, so they are configured once per process
+created_config = None
+
+# Full-text search over the markdown sections: words in a section's heading
+# count this many times as much as words in its body
+TOKEN_RE = re.compile(r'\w+')
+HEADING_TERM_WEIGHT = 3
+SEARCH_RESULT_LIMIT = 10
+MAX_SEARCH_RESULTS = 50
+SNIPPET_WIDTH = 200
+SNIPPET_STRIP_RE = re.compile(r'(?:[#*`>|]|\s)+')
 
 # Create a dictionary to map file extensions to their content types
 CONTENT_TYPES = {
@@ -49,141 +386,1734 @@ CONTENT_TYPES = {
     '.html': 'text/html'
 }
 
+# Markdown headings that get an id and appear in the TOC: "## " and "### " lines.
+# Matching on the leading newline (instead of ^ with MULTILINE) lets the regex
+# engine skip ahead with a literal search, which is several times faster.
+HEADING_RE = re.compile(rb'\n(##|###) ([^\n]*)')
+SLUG_STRIP_RE = re.compile(r'[^a-z0-9-]')
+
+HEADING_CLASSES = {
+    1: 'text-3xl font-bold text-blue-800 mb-6 mt-8',
+    2: 'text-2xl font-bold text-blue-800 mt-8 mb-4',
+    3: 'text-xl font-semibold text-blue-700 mt-6 mb-2',
+    4: 'text-lg font-semibold text-blue-600 mt-4 mb-1',
+    5: 'text-base font-semibold text-blue-500 mt-3 mb-1',
+    6: 'text-sm font-semibold text-blue-500 mt-3 mb-1'
+}
+
+def slugify(heading_text):
+    """Create a heading id from its text"""
+    return SLUG_STRIP_RE.sub('', heading_text.lower().replace(' ', '-'))
+
+class Heading:
+    """A TOC heading and the byte range of the section it starts.
+
+    start is the offset of the heading line, body_start the offset just
+    past it, and end the offset of the next heading (or end of file).
+    """
+    __slots__ = ('text', 'id', 'level', 'start', 'body_start', 'end')
+
+    def __init__(self, text, heading_id, level, start, body_start, end=None):
+        self.text = text
+        self.id = heading_id
+        self.level = level
+        self.start = start
+        self.body_start = body_start
+        self.end = end
+
+    def html(self):
+        """The anchored heading tag that replaces the markdown heading line"""
+        return f'<h{self.level} id="{self.id}" class="{HEADING_CLASSES[self.level]}">{self.text}</h{self.level}>'
+
+    def as_dict(self):
+        return {'text': self.text, 'id': self.id, 'level': self.level}
+
+class MarkdownDocument:
+    """Compiled form of a markdown file.
+
+    Holds the raw bytes, the processed content (headings rewritten to
+    anchored HTML), the heading records with their section byte offsets,
+    and the TOC as plain dicts ready for JSON/templates. The raw text is
+    only decoded if something asks for it.
+    """
+    __slots__ = ('path', 'version', 'digest', 'raw', 'processed_content',
+                 'headings', 'toc', 'heading_index', '_content', '_html')
+
+    def __init__(self, raw, processed_content, headings):
+        self.path = None
+        self.version = None
+        self.digest = None
+        self.raw = raw
+        self.processed_content = processed_content
+        self.headings = headings
+        self.toc = [heading.as_dict() for heading in headings]
+        self.heading_index = {heading.id: index for index, heading in enumerate(headings)}
+        self._content = None
+        self._html = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = self.raw.decode('utf-8')
+        return self._content
+
+    @property
+    def html(self):
+        """Fully rendered HTML, built on first use and kept for this version"""
+        if self._html is None:
+            self._html = render_markdown_html(self)
+        return self._html
+
+    @property
+    def size(self):
+        return len(self.raw)
+
+    @property
+    def last_modified(self):
+        return mtime_datetime(self.version[1])
+
+    def section(self, heading):
+        """Processed content of one section, sliced straight from the raw bytes"""
+        body = memoryview(self.raw)[heading.body_start:heading.end]
+        return heading.html() + str(body, 'utf-8')
+
+    def section_dict(self, heading):
+        return {
+            'text': heading.text,
+            'id': heading.id,
+            'level': heading.level,
+            'start': heading.start,
+            'end': heading.end,
+            'content': self.section(heading)
+        }
+
+def compile_markdown(raw):
+    """Compile markdown bytes into a MarkdownDocument in a single pass.
+
+    Headings are located with one regex scan over the raw bytes, so section
+    offsets are byte offsets into the file. Repeated slugs get a numeric
+    suffix (-1, -2, ...) so every id in the page stays unique.
+    """
+    headings = []
+    parts = []
+    seen = {}
+    position = 0
+
+    # Offsets in the padded buffer are shifted by one, so a match's start is
+    # the byte offset of the heading line in raw
+    for match in HEADING_RE.finditer(b'\n' + raw):
+        level = len(match.group(1))
+        heading_text = match.group(2).decode('utf-8').strip()
+        heading_id = slugify(heading_text)
+        if heading_id in seen:
+            seen[heading_id] += 1
+            heading_id = f"{heading_id}-{seen[heading_id]}"
+        seen.setdefault(heading_id, 0)
+
+        start = match.start()
+        if headings:
+            headings[-1].end = start
+        heading = Heading(heading_text, heading_id, level, start, match.end() - 1)
+        headings.append(heading)
+
+        parts.append(raw[position:start])
+        parts.append(heading.html().encode('utf-8'))
+        position = heading.body_start
+
+    if headings:
+        headings[-1].end = len(raw)
+    parts.append(raw[position:])
+
+    return MarkdownDocument(raw, b''.join(parts).decode('utf-8'), tuple(headings))
+
+def stream_markdown_records(f, record_size=STREAM_RECORD_SIZE):
+    """Yield the processed markdown of an open binary file as NDJSON records.
+
+    The file is read in blocks and each block, cut at its last newline, is
+    scanned with HEADING_RE as in compile_markdown, so ids match
+    /api/markdown and the TOC, and the contents of all records joined
+    together equal its processed content. The preamble before the first
+    heading has id None. A section longer than record_size bytes continues
+    in further records holding only its id, more content and
+    "continued": true. Only about one block and one record are in memory.
+    """
+    seen = {}
+    record = {'id': None, 'content': ''}
+    parts = []
+    size = 0
+    sections = 0
+
+    def emit():
+        record['content'] = ''.join(parts)
+        parts.clear()
+        return json.dumps(record) + '\n'
+
+    # Like compile_markdown, pad with a newline so a heading on the first
+    # line matches; pending always starts at a line break
+    pending = b'\n'
+    skip = 1
+    while True:
+        block = f.read(record_size)
+        data = pending + block
+        cut = data.rfind(b'\n') if block else len(data)
+        if cut <= 0:
+            pending = data
+            continue
+        region, pending = data[:cut], data[cut:]
+
+        position = skip
+        skip = 0
+        for match in HEADING_RE.finditer(region):
+            # The newline before the heading belongs to the previous section
+            if match.start() + 1 > position:
+                parts.append(region[position:match.start() + 1].decode('utf-8'))
+            if parts or record['id'] is not None:
+                yield emit()
+
+            level = len(match.group(1))
+            heading_text = match.group(2).decode('utf-8').strip()
+            heading_id = slugify(heading_text)
+            if heading_id in seen:
+                seen[heading_id] += 1
+                heading_id = f"{heading_id}-{seen[heading_id]}"
+            seen.setdefault(heading_id, 0)
+
+            heading = Heading(heading_text, heading_id, level, None, None)
+            record = {'id': heading_id, 'text': heading_text, 'level': level, 'content': ''}
+            parts.append(heading.html())
+            size = 0
+            sections += 1
+            position = match.end()
+
+        if position < len(region):
+            parts.append(region[position:].decode('utf-8'))
+            size += len(region) - position
+        if not block:
+            break
+        if size >= record_size:
+            yield emit()
+            record = {'id': record['id'], 'content': '', 'continued': True}
+            size = 0
+
+    if parts or record['id'] is not None:
+        yield emit()
+    yield json.dumps({'done': True, 'sections': sections}) + '\n'
+
 # Function to extract headings from markdown for TOC
 def extract_headings(markdown_text):
-    headings = []
-    lines = markdown_text.split('\n')
-    for line in lines:
-        if line.startswith('## '):
-            # Get the heading text and create an ID from it
-            heading_text = line[3:].strip()
-            heading_id = heading_text.lower().replace(' ', '-').replace(':', '').replace(',', '')
-            # Remove any remaining special characters
-            heading_id = re.sub(r'[^a-z0-9-]', '', heading_id)
-            headings.append({
-                'text': heading_text,
-                'id': heading_id,
-                'level': 2
-            })
-        elif line.startswith('### '):
-            heading_text = line[4:].strip()
-            heading_id = heading_text.lower().replace(' ', '-').replace(':', '').replace(',', '')
-            heading_id = re.sub(r'[^a-z0-9-]', '', heading_id)
-            headings.append({
-                'text': heading_text,
-                'id': heading_id,
-                'level': 3
-            })
-    return headings
+    return compile_markdown(markdown_text.encode('utf-8')).toc
 
 # Preprocess the markdown content to add IDs to headings
 def preprocess_markdown(markdown_text):
-    lines = markdown_text.split('\n')
-    processed_lines = []
-    
-    for line in lines:
-        if line.startswith('## '):
-            heading_text = line[3:].strip()
-            heading_id = heading_text.lower().replace(' ', '-').replace(':', '').replace(',', '')
-            heading_id = re.sub(r'[^a-z0-9-]', '', heading_id)
-            processed_lines.append(f'<h2 id="{heading_id}" class="text-2xl font-bold text-blue-800 mt-8 mb-4">{heading_text}</h2>')
-        elif line.startswith('### '):
-            heading_text = line[4:].strip()
-            heading_id = heading_text.lower().replace(' ', '-').replace(':', '').replace(',', '')
-            heading_id = re.sub(r'[^a-z0-9-]', '', heading_id)
-            processed_lines.append(f'<h3 id="{heading_id}" class="text-xl font-semibold text-blue-700 mt-6 mb-2">{heading_text}</h3>')
+    return compile_markdown(markdown_text.encode('utf-8')).processed_content
+
+# Server-side markdown rendering. Uses the same Tailwind classes as
+# static/js/markdown-renderer.js so both render modes look alike.
+MARKDOWN_CLASSES = {
+    'p': 'mb-4',
+    'ul': 'list-disc pl-5 space-y-2 mb-4',
+    'ol': 'list-decimal pl-5 space-y-2 mb-4',
+    'table_wrapper': 'overflow-x-auto my-6',
+    'table': 'min-w-full border-collapse border border-gray-300',
+    'th': 'border border-gray-300 bg-gray-100 px-4 py-2 text-left font-semibold',
+    'td': 'border border-gray-300 px-4 py-2',
+    'pre': 'bg-gray-100 p-4 rounded overflow-x-auto mb-4',
+    'code': 'bg-gray-100 px-1 py-0.5 rounded text-sm font-mono',
+    'a': 'text-blue-600 hover:underline',
+    'hr': 'my-6 border-t border-gray-300'
+}
+
+BLOCK_HEADING_RE = re.compile(r'^(#{1,6}) (.*)$')
+LIST_ITEM_RE = re.compile(r'^(\s*)([-*+]|\d+\.)\s+(.*)$')
+HR_RE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+TABLE_SEPARATOR_RE = re.compile(r'^\|[\s\-:|]+\|$')
+SUBHEADING_ITEM_RE = re.compile(r'^[A-Z].*?:$')
+INLINE_CODE_RE = re.compile(r'`([^`]+)`')
+INLINE_CODE_PLACEHOLDER_RE = re.compile(r'\x00(\d+)\x00')
+LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)')
+BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+EM_RE = re.compile(r'(?<![*\w])\*(?![\s*])(.+?)(?<![\s*])\*(?![*\w])')
+
+def render_inline(text):
+    """Render inline markdown (code spans, links, bold, italics) to HTML"""
+    code_spans = []
+
+    def stash_code(match):
+        code_spans.append(match.group(1))
+        return f'\x00{len(code_spans) - 1}\x00'
+
+    text = html.escape(INLINE_CODE_RE.sub(stash_code, text), quote=False)
+
+    def link(match):
+        href = match.group(2).replace('"', '&quot;')
+        return f'<a href="{href}" class="{MARKDOWN_CLASSES["a"]}">{match.group(1)}</a>'
+
+    text = LINK_RE.sub(link, text)
+    text = BOLD_RE.sub(r'<strong>\1</strong>', text)
+    text = EM_RE.sub(r'<em>\1</em>', text)
+
+    def restore_code(match):
+        code = html.escape(code_spans[int(match.group(1))], quote=False)
+        return f'<code class="{MARKDOWN_CLASSES["code"]}">{code}</code>'
+
+    if code_spans:
+        text = INLINE_CODE_PLACEHOLDER_RE.sub(restore_code, text)
+    return text
+
+def render_table(rows):
+    """Render consecutive |-delimited lines as a table"""
+    has_header = len(rows) > 1 and TABLE_SEPARATOR_RE.match(rows[1].strip())
+    cells = [
+        [cell.strip() for cell in row.strip()[1:-1].split('|')]
+        for row in rows if not TABLE_SEPARATOR_RE.match(row.strip())
+    ]
+    parts = [f'<div class="{MARKDOWN_CLASSES["table_wrapper"]}"><table class="{MARKDOWN_CLASSES["table"]}">']
+    if has_header:
+        header, cells = cells[0], cells[1:]
+        parts.append('<thead>\n<tr>')
+        for cell in header:
+            # Header cells are bold already, so drop any ** markup
+            cell = render_inline(BOLD_RE.sub(r'\1', cell))
+            parts.append(f'<th class="{MARKDOWN_CLASSES["th"]}">{cell}</th>')
+        parts.append('</tr>\n</thead>')
+    parts.append('<tbody>')
+    for row in cells:
+        parts.append('<tr>')
+        for cell in row:
+            parts.append(f'<td class="{MARKDOWN_CLASSES["td"]}">{render_inline(cell)}</td>')
+        parts.append('</tr>')
+    parts.append('</tbody>\n</table></div>')
+    return '\n'.join(parts)
+
+def render_markdown_html(document):
+    """Render a MarkdownDocument to final HTML.
+
+    ## and ### headings take their ids and text from document.headings, so
+    anchors match the TOC and preprocess_markdown exactly. Supports fenced
+    code, tables, nested bullet/numbered lists, rules, links and emphasis.
+    """
+    out = []
+    headings = iter(document.headings)
+    paragraph = []
+    table = []
+    list_stack = []  # [indent, tag] for each open list
+    code_block = None
+
+    def flush_paragraph():
+        if paragraph:
+            text = render_inline('\n'.join(paragraph))
+            out.append(f'<p class="{MARKDOWN_CLASSES["p"]}">{text}</p>')
+            paragraph.clear()
+
+    def flush_table():
+        if table:
+            out.append(render_table(table))
+            table.clear()
+
+    def open_list(indent, tag):
+        out.append(f'<{tag} class="{MARKDOWN_CLASSES[tag]}">')
+        list_stack.append([indent, tag])
+
+    def close_list():
+        out.append(f'</li></{list_stack.pop()[1]}>')
+
+    def emit_code_block():
+        language = html.escape(code_block[0] or 'text')
+        code = html.escape('\n'.join(code_block[1:]), quote=False)
+        out.append(f'<pre class="{MARKDOWN_CLASSES["pre"]}"><code class="language-{language}">{code}</code></pre>')
+
+    def flush_blocks():
+        flush_paragraph()
+        flush_table()
+        while list_stack:
+            close_list()
+
+    for line in document.content.split('\n'):
+        if code_block is not None:
+            if line.startswith(('## ', '### ')):
+                next(headings, None)
+            if line.strip().startswith('```'):
+                emit_code_block()
+                code_block = None
+            else:
+                code_block.append(line)
+            continue
+
+        stripped = line.strip()
+        if stripped.startswith('```'):
+            flush_blocks()
+            code_block = [stripped[3:].strip()]
+            continue
+
+        if stripped.startswith('|') and stripped.endswith('|') and len(stripped) > 1:
+            flush_paragraph()
+            while list_stack:
+                close_list()
+            table.append(line)
+            continue
+        flush_table()
+
+        heading_match = BLOCK_HEADING_RE.match(line)
+        if heading_match:
+            flush_blocks()
+            level = len(heading_match.group(1))
+            heading = next(headings, None) if level in (2, 3) else None
+            if heading is not None:
+                out.append(f'<h{level} id="{heading.id}" class="{HEADING_CLASSES[level]}">{render_inline(heading.text)}</h{level}>')
+            else:
+                out.append(f'<h{level} class="{HEADING_CLASSES[level]}">{render_inline(heading_match.group(2).strip())}</h{level}>')
+            continue
+
+        if HR_RE.match(line):
+            flush_blocks()
+            out.append(f'<hr class="{MARKDOWN_CLASSES["hr"]}">')
+            continue
+
+        item_match = LIST_ITEM_RE.match(line)
+        if item_match:
+            flush_paragraph()
+            indent = len(item_match.group(1).expandtabs(4))
+            tag = 'ul' if item_match.group(2) in '-*+' else 'ol'
+            while list_stack and indent < list_stack[-1][0]:
+                close_list()
+            if list_stack and indent > list_stack[-1][0]:
+                open_list(indent, tag)
+            elif list_stack and list_stack[-1][1] == tag:
+                out.append('</li>')
+            else:
+                if list_stack:
+                    close_list()
+                open_list(indent, tag)
+            content = item_match.group(3).strip()
+            if tag == 'ul' and SUBHEADING_ITEM_RE.match(content):
+                out.append(f'<li class="font-bold">{render_inline(content)}')
+            else:
+                out.append(f'<li>{render_inline(content)}')
+            continue
+
+        if not stripped:
+            flush_blocks()
+        elif list_stack and line[:1].isspace():
+            # Indented continuation of the current list item
+            out.append(' ' + render_inline(stripped))
         else:
-            processed_lines.append(line)
-            
-    return '\n'.join(processed_lines)
+            while list_stack:
+                close_list()
+            paragraph.append(stripped)
+
+    # An unterminated fence runs to the end of the document
+    if code_block is not None:
+        emit_code_block()
+    flush_blocks()
+    return '\n'.join(out)
+
+def file_version(st):
+    """Identity of a file's current contents, taken from its stat result"""
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def mtime_datetime(mtime_ns):
+    return datetime.fromtimestamp(mtime_ns / 1e9, timezone.utc)
+
+class DocumentCache:
+    """Thread-safe LRU cache of parsed markdown documents.
+
+    Entries are keyed on the file path and validated against the file's
+    inode, mtime and size, so a document is parsed once per change rather
+    than once per request. Once the cached documents hold more than
+    max_bytes (source plus processed text), the least recently used are
+    dropped and on_evict(path) is called for each; the document just
+    parsed is always kept.
+    """
+
+    def __init__(self, max_bytes=DOCUMENT_CACHE_MAX_BYTES, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        # Path -> Event set when the build of that document in progress ends
+        self._building = {}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _cost(entry):
+        return entry.size + len(entry.processed_content)
+
+    def get(self, path, version=None):
+        """Return the MarkdownDocument for path, rebuilding it if the file changed.
+
+        version, if known (e.g. from the data manifest), saves a stat call.
+        Raises OSError if the file cannot be stat'ed or read.
+        """
+        if version is None:
+            version = file_version(os.stat(path))
+        # Only one thread builds a given document; others wanting the same
+        # one wait and pick up its result, other documents build in parallel
+        while True:
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None and entry.version == version:
+                    self.hits += 1
+                    self._entries.move_to_end(path)
+                    return entry
+                building = self._building.get(path)
+                if building is None:
+                    building = self._building[path] = threading.Event()
+                    break
+            building.wait()
+            version = file_version(os.stat(path))
+
+        try:
+            with open(path, 'rb') as f:
+                version = file_version(os.fstat(f.fileno()))
+                raw = f.read()
+            entry = compile_markdown(raw)
+            entry.path = path
+            entry.version = version
+            entry.digest = hashlib.sha1(raw).hexdigest()
+
+            evicted = []
+            with self._lock:
+                self._remove(path)
+                self._entries[path] = entry
+                self._bytes += self._cost(entry)
+                self.misses += 1
+                while self._bytes > self.max_bytes and len(self._entries) > 1:
+                    oldest = next(iter(self._entries))
+                    self._remove(oldest)
+                    evicted.append(oldest)
+                self.evictions += len(evicted)
+        finally:
+            with self._lock:
+                del self._building[path]
+            building.set()
+        logger.info(f"Document cache rebuilt {path}: {len(entry.headings)} headings, {entry.size} bytes")
+        if self.on_evict is not None:
+            for evicted_path in evicted:
+                self.on_evict(evicted_path)
+        return entry
+
+    def _remove(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= self._cost(entry)
+
+    def invalidate(self, path=None):
+        """Drop one cached document, or all of them"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._remove(path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
+
+def document_evicted(path):
+    """Drop what was derived from a document that left the document cache"""
+    search_index.forget(path)
+
+document_cache = DocumentCache(on_evict=document_evicted)
+
+class IndexedSection:
+    """One section of a document as seen by the search index"""
+    __slots__ = ('key', 'heading', 'text', 'plain', 'terms', 'length')
+
+    def __init__(self, key, heading, text):
+        self.key = key
+        self.heading = heading
+        self.text = text
+        # Markup-free text the snippets are cut from
+        self.plain = SNIPPET_STRIP_RE.sub(' ', text).strip()
+        terms = {}
+        for term in TOKEN_RE.findall(text.lower()):
+            terms[term] = terms.get(term, 0) + 1
+        if heading is not None:
+            for term in TOKEN_RE.findall(heading.text.lower()):
+                terms[term] = terms.get(term, 0) + HEADING_TERM_WEIGHT
+        self.terms = terms
+        self.length = sum(terms.values())
+
+class DocumentIndex:
+    """Inverted index over the sections of one markdown document.
+
+    Sections are keyed by heading id (the text before the first heading
+    has the key ''). update() compares each section with what is already
+    indexed and only re-tokenizes the ones whose text changed.
+    """
+
+    def __init__(self):
+        self.digest = None
+        self.sections = {}
+        self.postings = {}
+        self.total_length = 0
+
+    def update(self, document):
+        """Bring the index up to date with document; returns the number of sections re-indexed"""
+        raw = document.raw
+        ranges = []
+        first = document.headings[0].start if document.headings else len(raw)
+        if raw[:first].strip():
+            ranges.append(('', None, 0, first))
+        ranges.extend((heading.id, heading, heading.body_start, heading.end) for heading in document.headings)
+
+        sections = {}
+        reindexed = 0
+        for key, heading, start, end in ranges:
+            text = raw[start:end].decode('utf-8')
+            section = self.sections.get(key)
+            if section is not None and section.text == text and (
+                    heading is None or section.heading.text == heading.text):
+                # Unchanged: keep its postings, only the offsets may have moved
+                section.heading = heading
+            else:
+                if section is not None:
+                    self._remove(section)
+                section = IndexedSection(key, heading, text)
+                self._add(section)
+                reindexed += 1
+            sections[key] = section
+
+        for key, section in self.sections.items():
+            if key not in sections:
+                self._remove(section)
+        self.sections = sections
+        self.digest = document.digest
+        return reindexed
+
+    def _add(self, section):
+        for term, count in section.terms.items():
+            self.postings.setdefault(term, {})[section.key] = count
+        self.total_length += section.length
+
+    def _remove(self, section):
+        for term in section.terms:
+            postings = self.postings[term]
+            del postings[section.key]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= section.length
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        """Rank sections for query with BM25; returns (total matches, top results)"""
+        terms = list(dict.fromkeys(TOKEN_RE.findall(query.lower())))
+        if not terms or not self.sections:
+            return 0, []
+
+        count = len(self.sections)
+        average_length = self.total_length / count or 1
+        k1, b = 1.2, 0.75
+        scores = {}
+        matched = {}
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, frequency in postings.items():
+                length = self.sections[key].length
+                scores[key] = scores.get(key, 0.0) + idf * frequency * (k1 + 1) / (
+                    frequency + k1 * (1 - b + b * length / average_length))
+                matched[key] = matched.get(key, 0) + 1
+
+        # Sections containing more of the query terms always rank first
+        top = heapq.nlargest(limit, scores, key=lambda key: (matched[key], scores[key]))
+        pattern = re.compile(r'\b(?:' + '|'.join(map(re.escape, terms)) + r')\b', re.IGNORECASE)
+        results = []
+        for key in top:
+            section = self.sections[key]
+            heading = section.heading
+            results.append({
+                'id': heading.id if heading is not None else None,
+                'text': heading.text if heading is not None else None,
+                'level': heading.level if heading is not None else None,
+                'score': round(scores[key], 4),
+                'matched_terms': matched[key],
+                'snippet': search_snippet(section.plain, pattern)
+            })
+        return len(scores), results
+
+def search_snippet(plain, pattern, width=SNIPPET_WIDTH):
+    """HTML excerpt of plain around the first match of pattern, matches wrapped in <mark>"""
+    match = pattern.search(plain)
+    start = 0 if match is None else max(0, match.start() - width // 4)
+    if start:
+        # Begin on a word boundary
+        space = plain.find(' ', start)
+        start = space + 1 if 0 <= space < match.start() else start
+    end = min(len(plain), start + width)
+    if end < len(plain):
+        space = plain.rfind(' ', start, end)
+        end = space if space > start else end
+
+    excerpt = plain[start:end]
+    parts = []
+    position = 0
+    for found in pattern.finditer(excerpt):
+        parts.append(html.escape(excerpt[position:found.start()]))
+        parts.append(f'<mark>{html.escape(found.group(0))}</mark>')
+        position = found.end()
+    parts.append(html.escape(excerpt[position:]))
+    return ('…' if start else '') + ''.join(parts) + ('…' if end < len(plain) else '')
+
+class SearchIndex:
+    """Thread-safe registry of DocumentIndex objects, one per document path"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = {}
+        self.updates = 0
+        self.reindexed = 0
+
+    def _index(self, document):
+        index = self._documents.get(document.path)
+        if index is None:
+            index = self._documents[document.path] = DocumentIndex()
+        if index.digest != document.digest:
+            reindexed = index.update(document)
+            self.updates += 1
+            self.reindexed += reindexed
+            logger.info(f"Search index updated {document.path}: {reindexed} of {len(index.sections)} sections re-indexed")
+        return index
+
+    def forget(self, path):
+        """Drop the index of a document; it is rebuilt if searched again"""
+        with self._lock:
+            self._documents.pop(path, None)
+
+    def index(self, document):
+        """Bring the index of document up to date without searching"""
+        with self._lock:
+            self._index(document)
+
+    def search(self, document, query, limit=SEARCH_RESULT_LIMIT):
+        """Search document, first re-indexing whatever changed since the last call"""
+        with self._lock:
+            return self._index(document).search(query, limit)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'documents': len(self._documents),
+                'sections': sum(len(index.sections) for index in self._documents.values()),
+                'terms': sum(len(index.postings) for index in self._documents.values()),
+                'updates': self.updates,
+                'reindexed': self.reindexed
+            }
+
+search_index = SearchIndex()
+
+class FileDigestCache:
+    """Content digests of served files, recomputed only when a file's stat changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, version=None):
+        """Return (sha1 hex digest, last-modified datetime) for path.
+
+        version, if known (e.g. from the data manifest), saves a stat call.
+        Raises OSError if the file cannot be stat'ed or read.
+        """
+        if version is None:
+            version = file_version(os.stat(path))
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        entry = (version, digest.hexdigest(), mtime_datetime(version[1]))
+        with self._lock:
+            self._entries[path] = entry
+        return entry[1], entry[2]
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+file_digests = FileDigestCache()
+
+class ManifestEntry:
+    """A file in the data manifest; name is its '/'-separated path below the root"""
+    __slots__ = ('name', 'path', 'version', 'type', 'info')
+
+    def __init__(self, name, path, st):
+        self.name = name
+        self.path = path
+        self.version = file_version(st)
+        self.type = CONTENT_TYPES.get(os.path.splitext(name)[1], 'text/plain')
+        self.info = {'name': name, 'type': self.type, 'size': st.st_size}
+
+    @property
+    def size(self):
+        return self.version[2]
+
+    @property
+    def last_modified(self):
+        return mtime_datetime(self.version[1])
+
+class DataManifest:
+    """In-memory listing of every file below a directory.
+
+    Built with one scan and kept current by a DirectoryWatcher (inotify, or
+    polling where inotify is unavailable), so request handlers can look up
+    files, sizes, versions and mermaid aliases without touching the
+    filesystem. The scan and watcher start on first use. A batch of
+    changes updates the entries, the checksum and the mermaid aliases per
+    changed file, and the sorted names with one list insert or delete each
+    (no re-sort, no rescan). The sorted listings behind files() and
+    select() are rebuilt lazily, once per generation, by the first call
+    that needs them, so a burst of changes with no listing request in
+    between does not walk the whole tree each time.
+    """
+
+    # Filtered listings remembered per generation by select()
+    MAX_SELECTIONS = 64
+
+    def __init__(self, root, watch_mode='auto', poll_interval=2.0, on_change=None):
+        self.root = root
+        self.watch_mode = watch_mode
+        self.poll_interval = poll_interval
+        # Called from the watcher thread after a batch of changes has been
+        # applied, with the absolute paths of the files that were removed
+        self.on_change = on_change
+        self.watcher = None
+        self.digest = None
+        self.last_modified = None
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._started = False
+        self._entries = {}
+        self._names = []
+        self._checksum = 0
+        self._newest = 0
+        # (every entry, top-level entries), or None until files() needs them
+        self._listings = None
+        self._mermaid = {}
+        self._selections = OrderedDict()
+
+    def _ensure_started(self):
+        if not self._started:
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            # Watch first so nothing changed during the scan is missed
+            self.watcher = DirectoryWatcher(self.root, self.refresh, mode=self.watch_mode,
+                                            poll_interval=self.poll_interval)
+            try:
+                mode = self.watcher.start()
+                logger.info(f"Watching {self.root} for changes ({mode})")
+            except OSError as e:
+                logger.error(f"Failed to watch {self.root}: {str(e)}")
+                self.watcher = None
+            self.scan()
+            self._started = True
+
+    def stop(self):
+        with self._lock:
+            if self.watcher is not None:
+                self.watcher.stop()
+                self.watcher = None
+            self._started = False
+
+    def after_fork(self):
+        """Restart watching in a forked child.
+
+        The watcher thread does not survive fork, so a preloaded manifest
+        would otherwise go stale in every worker. The rescan keeps the
+        entries that did not change.
+        """
+        self._lock = threading.RLock()
+        if self.watcher is not None:
+            self.watcher.forget()
+            self.watcher = None
+        if self._started:
+            self._started = False
+            self.start()
+
+    def _name(self, path):
+        name = os.path.relpath(path, self.root)
+        if name == '.' or name.startswith('..'):
+            return None
+        return name.replace(os.sep, '/')
+
+    @staticmethod
+    def _fingerprint(entry):
+        # Summed over all entries, so the digest can be updated one file at a time
+        return int.from_bytes(hashlib.sha1(repr((entry.name, entry.version)).encode('utf-8')).digest(), 'big')
+
+    def scan(self):
+        """Rebuild the whole manifest from the filesystem"""
+        previous = self._entries
+        entries = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    name = self._name(path)
+                    # Keep unchanged entries, so a rescan in a forked worker
+                    # does not copy what it shares with the parent
+                    entry = previous.get(name)
+                    if entry is None or entry.version != file_version(st):
+                        entry = ManifestEntry(name, path, st)
+                    entries[name] = entry
+        with self._lock:
+            self._entries = entries
+            self._names = sorted(entries)
+            self._checksum = sum(map(self._fingerprint, entries.values()))
+            self._newest = max((entry.version[1] for entry in entries.values()), default=0)
+            self._mermaid = {}
+            self._rebuild(self._names)
+
+    def refresh(self, paths):
+        """Apply a batch of changed paths reported by the watcher (None means rescan)"""
+        if paths is None:
+            previous = self._entries
+            self.scan()
+            self._changed([entry.path for name, entry in previous.items() if name not in self._entries])
+            return
+
+        updates = {}
+        for path in paths:
+            name = self._name(path)
+            if name is None:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is not None and stat.S_ISDIR(st.st_mode):
+                # Files inside new directories are reported individually
+                continue
+            updates[name] = ManifestEntry(name, path, st) if st is not None and stat.S_ISREG(st.st_mode) else None
+
+        with self._lock:
+            entries = self._entries
+            changed = []
+            for name, entry in updates.items():
+                if entry is None and name not in entries:
+                    # Not a known file, so possibly a directory that went away
+                    prefix = name + '/'
+                    start = bisect.bisect_left(self._names, prefix)
+                    end = start
+                    while end < len(self._names) and self._names[end].startswith(prefix):
+                        end += 1
+                    changed.extend((stale, None) for stale in self._names[start:end])
+                else:
+                    changed.append((name, entry))
+
+            stale_newest = False
+            removed = []
+            for name, entry in changed:
+                old = entries.get(name)
+                if old is not None:
+                    self._checksum -= self._fingerprint(old)
+                    stale_newest = stale_newest or old.version[1] >= self._newest
+                if entry is None:
+                    if old is not None:
+                        del entries[name]
+                        del self._names[bisect.bisect_left(self._names, name)]
+                        removed.append(old.path)
+                    continue
+                if old is None:
+                    bisect.insort(self._names, name)
+                entries[name] = entry
+                self._checksum += self._fingerprint(entry)
+                self._newest = max(self._newest, entry.version[1])
+            if not changed:
+                return
+            if stale_newest:
+                self._newest = max((entry.version[1] for entry in entries.values()), default=0)
+            self._rebuild([name for name, _ in changed])
+        self._changed(removed)
+
+    def _changed(self, removed):
+        if self.on_change is not None:
+            try:
+                self.on_change(removed)
+            except Exception as e:
+                logger.error(f"Error handling change in {self.root}: {str(e)}")
+
+    def _rebuild(self, changed):
+        """Refresh the mermaid aliases after names in changed moved, and drop the listings"""
+        entries = self._entries
+        # Only diagram base names touched by this batch need re-resolving
+        for name in changed:
+            base_name, ext = os.path.splitext(name)
+            if '/' in base_name or ext not in ('.mermaid', '.txt'):
+                continue
+            entry = entries.get(base_name + '.mermaid') or entries.get(base_name + '.txt')
+            if entry is not None:
+                self._mermaid[base_name] = entry
+            else:
+                self._mermaid.pop(base_name, None)
+
+        self._listings = None
+        self._selections.clear()
+        self.digest = f"{self._checksum % (1 << 160):040x}"
+        self.last_modified = mtime_datetime(self._newest) if entries else None
+        self.generation += 1
+
+    def get(self, name):
+        """The entry for a '/'-separated path below the root, or None"""
+        self._ensure_started()
+        return self._entries.get(name)
+
+    def files(self, recursive=False):
+        """Entries sorted by name; top-level files only unless recursive"""
+        self._ensure_started()
+        listings = self._listings
+        if listings is None:
+            with self._lock:
+                if self._listings is None:
+                    entries = self._entries
+                    listing = tuple(
+                        entries[name] for name in self._names
+                        # Precompressed siblings are an encoding of another file, not a file of their own
+                        if not (name.endswith(PRECOMPRESSED_SUFFIXES) and os.path.splitext(name)[0] in entries)
+                    )
+                    self._listings = (listing, tuple(entry for entry in listing if '/' not in entry.name))
+                listings = self._listings
+        return listings[0] if recursive else listings[1]
+
+    def select(self, prefix='', extensions=(), query='', recursive=False):
+        """Return (digest, last_modified, entries) for a filtered listing.
+
+        query is matched case-insensitively. Results are remembered until
+        the next change, so repeated searches over a large tree cost a
+        dictionary lookup.
+        """
+        self._ensure_started()
+        key = (prefix, extensions, query.lower(), recursive)
+        with self._lock:
+            entries = self._selections.get(key)
+            if entries is None:
+                entries = self.files(recursive)
+                if prefix or query or extensions:
+                    entries = tuple(
+                        entry for entry in entries
+                        if entry.name.startswith(prefix)
+                        and (not extensions or entry.name.endswith(extensions))
+                        and (not query or key[2] in entry.name.lower())
+                    )
+                self._selections[key] = entries
+                if len(self._selections) > self.MAX_SELECTIONS:
+                    self._selections.popitem(last=False)
+            else:
+                self._selections.move_to_end(key)
+            return self.digest, self.last_modified, entries
+
+    def find_mermaid(self, base_name):
+        """The .mermaid (preferred) or .txt file for a diagram base name, or None"""
+        self._ensure_started()
+        return self._mermaid.get(base_name)
+
+    def mtime_ns(self, path):
+        """mtime of an absolute path below the root, or None if it is not a known file"""
+        name = self._name(path)
+        entry = self.get(name) if name is not None else None
+        return entry.version[1] if entry is not None else None
+
+    def stats(self):
+        self._ensure_started()
+        return {
+            'mode': self.watcher.mode if self.watcher is not None else None,
+            'entries': len(self._entries),
+            'generation': self.generation,
+            'events': self.watcher.events if self.watcher is not None else 0,
+            'digest': self.digest
+        }
+
+    def current_digest(self):
+        """Digest of the listing, which changes whenever a file is added, removed or modified"""
+        self._ensure_started()
+        return self.digest
+
+def data_changed(removed):
+    """Drop what was built from DATA_DIR after a change.
+
+    Cached responses are invalidated for every process sharing the cache.
+    Parsed documents and search indexes of removed files are dropped here;
+    every worker's own watcher does the same for its copies.
+    """
+    # Every worker's watcher reports the same change; the digest lets the
+    # first one clear a shared cache and the others skip it
+    response_bodies.invalidate(data_manifest.digest)
+    for path in removed:
+        document_cache.invalidate(path)
+        search_index.forget(path)
+
+data_manifest = DataManifest(DATA_DIR, watch_mode=DATA_WATCH_MODE, poll_interval=DATA_WATCH_POLL_INTERVAL,
+                             on_change=data_changed)
+# Pages are keyed on the digests of these, so page_cache notices edited
+# templates and static files from the watchers instead of a stat per request
+template_manifest = DataManifest(TEMPLATE_DIR, watch_mode=DATA_WATCH_MODE, poll_interval=DATA_WATCH_POLL_INTERVAL)
+static_manifest = DataManifest(STATIC_DIR, watch_mode=DATA_WATCH_MODE, poll_interval=DATA_WATCH_POLL_INTERVAL)
+
+def manifests_after_fork():
+    # Looked up at fork time, since create_app() may replace the manifests
+    for manifest in (data_manifest, template_manifest, static_manifest):
+        manifest.after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=manifests_after_fork)
+
+def configured_manifest(manifest, root, on_change=None):
+    """manifest if it matches root and the watch settings, else a new one replacing it"""
+    watch_mode, poll_interval = app.config['DATA_WATCH_MODE'], app.config['DATA_WATCH_POLL_INTERVAL']
+    if (manifest.root, manifest.watch_mode, manifest.poll_interval) == (root, watch_mode, poll_interval):
+        return manifest
+    manifest.stop()
+    return DataManifest(root, watch_mode=watch_mode, poll_interval=poll_interval, on_change=on_change)
+
+def find_document(doc=None):
+    """Return (name, manifest entry or None) for a markdown document.
+
+    doc is a '/'-separated path below DATA_DIR, with or without the .md
+    extension; None means DEFAULT_DOCUMENT. Documents are looked up in the
+    data manifest, so nothing is read until one is requested.
+    """
+    name = doc or app.config['DEFAULT_DOCUMENT']
+    if not name.endswith(MARKDOWN_EXTENSION):
+        name += MARKDOWN_EXTENSION
+    return name, data_manifest.get(name)
+
+def markdown_documents(prefix='', query=''):
+    """Return (digest, last_modified, entries) for the .md files below DATA_DIR"""
+    return data_manifest.select(prefix, (MARKDOWN_EXTENSION,), query, recursive=True)
+
+def document_id(entry):
+    """The name a document is requested by: its path without .md"""
+    return entry.name[:-len(MARKDOWN_EXTENSION)]
+
+def etag_for(*parts):
+    """Strong ETag for a response derived from in-memory data"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+def not_modified(etag, last_modified=None, variants=()):
+    """Return a 304 response if the request's validators still match, else None.
+
+    Called before the body is built, so a revalidation costs no file read
+    and no JSON encoding. variants are the ETags of other encodings of the
+    same content, which match as well; the 304 carries the tag that matched.
+    """
+    for candidate in (etag,) + tuple(variants):
+        if not is_resource_modified(request.environ, etag=candidate, last_modified=last_modified):
+            return with_validators(app.response_class(status=304), candidate, last_modified)
+    return None
+
+def with_validators(response, etag, last_modified=None):
+    """Attach ETag/Last-Modified and ask clients to revalidate before reuse"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+# Content encodings in order of preference. Precompressed siblings are
+# written by "flask --app app precompress"; JSON bodies are compressed on
+# the fly and cached.
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+AVAILABLE_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+PRECOMPRESSED_SUFFIXES = tuple(ENCODING_SUFFIXES.values())
+COMPRESSIBLE_EXTENSIONS = {'.md', '.tsx', '.mermaid', '.txt', '.json', '.js', '.css', '.html', '.svg'}
+PRECOMPRESS_MIN_SIZE = 1024
+
+def compress(data, encoding, best=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+def negotiate_encoding(encodings=AVAILABLE_ENCODINGS):
+    """Pick the encoding the client prefers from encodings, or None for identity"""
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = request.accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def file_mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def precompressed_encoding(path, mtime_of=file_mtime_ns):
+    """Pick the best up-to-date precompressed sibling of path the client accepts.
+
+    mtime_of returns a path's mtime in ns, or None if it does not exist;
+    data files pass data_manifest.mtime_ns to avoid stat calls.
+    """
+    accepted = [encoding for encoding in AVAILABLE_ENCODINGS if request.accept_encodings.quality(encoding) > 0]
+    if not accepted:
+        return None
+    mtime_ns = mtime_of(path)
+    # precompress_directory stamps each sibling with its source's mtime
+    fresh = [
+        encoding for encoding in accepted
+        if mtime_ns is not None and mtime_of(path + ENCODING_SUFFIXES[encoding]) == mtime_ns
+    ]
+    return negotiate_encoding(fresh)
+
+def send_variant(directory, filename, encoding, mimetype=None, etag=True):
+    """send_from_directory for filename or its precompressed sibling"""
+    if encoding is None:
+        response = send_from_directory(directory, filename, mimetype=mimetype, etag=etag)
+    else:
+        mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(directory, filename + ENCODING_SUFFIXES[encoding],
+                                       mimetype=mimetype, etag=etag)
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def variant_etag(etag, encoding):
+    return etag if encoding is None else f"{etag}-{encoding}"
+
+def precompress_directory(directory):
+    """Write .gz/.br siblings for compressible files under directory.
+
+    Siblings get the source file's mtime so stale ones are easy to spot.
+    Returns the number of files written.
+    """
+    written = 0
+    for root, dirs, files in os.walk(directory):
+        for filename in files:
+            if filename.endswith(PRECOMPRESSED_SUFFIXES):
+                continue
+            if os.path.splitext(filename)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(root, filename)
+            st = os.stat(path)
+            if st.st_size < PRECOMPRESS_MIN_SIZE:
+                continue
+            data = None
+            for encoding in AVAILABLE_ENCODINGS:
+                target = path + ENCODING_SUFFIXES[encoding]
+                try:
+                    if os.stat(target).st_mtime_ns == st.st_mtime_ns:
+                        continue
+                except OSError:
+                    pass
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                with open(target + '.tmp', 'wb') as f:
+                    f.write(compress(data, encoding, best=True))
+                os.replace(target + '.tmp', target)
+                os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+                written += 1
+    return written
+
+@app.cli.command('precompress')
+def precompress_command():
+    """Write precompressed .gz/.br siblings for static and data files"""
+    for directory in (app.config['STATIC_DIR'], app.config['DATA_DIR']):
+        written = precompress_directory(directory)
+        click.echo(f"{directory}: wrote {written} compressed files")
+    if brotli is None:
+        click.echo("brotli is not installed; only .gz files were written")
+
+# Encoded (and possibly compressed) response bodies keyed by ETag, in the
+# backend chosen by CACHE_BACKEND; create_app() replaces this default
+response_bodies = cache.MemoryCache(max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL or None)
+
+def conditional_json(etag, last_modified, build):
+    """JSON response for build() with conditional GET and cached encoding.
+
+    The encoded (and, if negotiated, compressed) body is cached by ETag and
+    build is only called on a cache miss, so repeat requests skip both the
+    JSON encoding and the compression.
+    """
+    encoding = negotiate_encoding()
+    etag = variant_etag(etag, encoding)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        cached.vary.add('Accept-Encoding')
+        return cached
+
+    body = response_bodies.get(etag)
+    if body is None:
+        body = jsonify(build()).get_data()
+        if encoding is not None:
+            body = compress(body, encoding)
+        response_bodies.set(etag, body)
+    response = app.response_class(body, mimetype='application/json')
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    return with_validators(response, etag, last_modified)
+
+class CachedPage:
+    """A rendered page as UTF-8 bytes, compressed per encoding on first use"""
+
+    def __init__(self, key, html):
+        self.key = key
+        self.data = html.encode('utf-8')
+        self.etag = hashlib.sha1(self.data).hexdigest()
+        self._bodies = {None: self.data}
+
+    def body(self, encoding):
+        body = self._bodies.get(encoding)
+        if body is None:
+            body = self._bodies[encoding] = compress(self.data, encoding)
+        return body
+
+class PageCache:
+    """Rendered pages, kept until the inputs they were rendered from change.
+
+    Each page name holds one entry, keyed on the values it was rendered
+    from: the document version and the digests of template_manifest and
+    static_manifest among them. Those are kept current by the watchers, so
+    a hit costs a comparison and no filesystem access.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, key, render):
+        """The CachedPage for template name and key; render() produces the HTML on a miss"""
+        with self._lock:
+            page = self._entries.get(name)
+        if page is not None and page.key == key:
+            with self._lock:
+                self.hits += 1
+            return page
+
+        page = CachedPage(key, render())
+        with self._lock:
+            self._entries[name] = page
+            self.misses += 1
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+page_cache = PageCache()
+
+def page_response(page):
+    """Send a CachedPage: 304 if the client has it, else the bytes for its preferred encoding"""
+    encoding = negotiate_encoding()
+    etag = variant_etag(page.etag, encoding)
+    others = [variant_etag(page.etag, other) for other in (None,) + AVAILABLE_ENCODINGS if other != encoding]
+    cached = not_modified(etag, variants=others)
+    if cached:
+        cached.vary.add('Accept-Encoding')
+        return cached
+    response = app.response_class(page.body(encoding), mimetype='text/html')
+    response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    return with_validators(response, etag)
+
+# Request metrics, exposed at /metrics in the Prometheus text format
+metrics_registry = metrics.Registry(METRICS_DIR)
+request_count = metrics_registry.counter(
+    'http_requests_total', 'Requests handled, by route, method and status', ('route', 'method', 'status'))
+request_latency = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route and method', ('route', 'method'))
+response_size = metrics_registry.histogram(
+    'http_response_size_bytes', 'Response body size, by route', ('route',),
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+requests_in_progress = metrics_registry.gauge(
+    'http_requests_in_progress', 'Requests being handled, by route and method', ('route', 'method'))
+cache_hits = metrics_registry.counter('cache_hits_total', 'Cache lookups that found an entry', ('cache',))
+cache_misses = metrics_registry.counter('cache_misses_total', 'Cache lookups that missed', ('cache',))
+cache_hit_ratio = metrics_registry.gauge('cache_hit_ratio', 'Share of cache lookups that hit, over all workers', ('cache',))
+
+def cache_stats():
+    return {
+        'document': document_cache.stats(),
+        'response_body': response_bodies.stats(),
+        'file_digest': file_digests.stats(),
+        'page': page_cache.stats(),
+        'asset_bundle': {key: sum(bundle.stats()[key] for bundle in asset_bundles.values())
+                         for key in ('hits', 'misses')}
+    }
+
+@app.before_request
+def start_request_metrics():
+    # Label by URL rule, not path, to keep the number of series bounded
+    g.metrics_labels = (request.url_rule.rule if request.url_rule is not None else 'unmatched', request.method)
+    g.request_started = time.perf_counter()
+    requests_in_progress.inc(g.metrics_labels)
+
+@app.after_request
+def record_request_metrics(response):
+    labels = g.get('metrics_labels')
+    if labels is None:
+        return response
+    request_latency.observe(labels, time.perf_counter() - g.request_started)
+    request_count.inc(labels + (str(response.status_code),))
+    size = response.calculate_content_length()
+    if size is not None:
+        response_size.observe(labels[:1], size)
+    # Cache counters live on the cache objects; mirror this worker's totals
+    for name, stats in cache_stats().items():
+        cache_hits.set_total((name,), stats['hits'])
+        cache_misses.set_total((name,), stats['misses'])
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    labels = g.pop('metrics_labels', None)
+    if labels is not None:
+        requests_in_progress.dec(labels)
 
 @app.route('/')
 def index():
-    """Render the main application page"""
+    """Render the main application page, or send the cached rendering"""
+    markdown_file, entry = find_document()
+    key = (entry.version if entry is not None else None, template_manifest.current_digest(),
+           static_manifest.current_digest(), app.config['MARKDOWN_RENDER_MODE'], bundling_enabled(),
+           request.script_root)
+    return page_response(page_cache.get('index.html', key, lambda: render_index(markdown_file, entry)))
+
+def render_index(markdown_file, entry):
     # Check if main markdown file exists
-    markdown_file = os.path.join(DATA_DIR, 'ai-first.md')
     headings = []
     
-    if os.path.exists(markdown_file):
+    if entry is not None:
         try:
-            with open(markdown_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                headings = extract_headings(content)
-            logger.info(f"Successfully loaded markdown file with {len(headings)} headings")
+            headings = document_cache.get(entry.path, entry.version).toc
         except Exception as e:
             logger.error(f"Error loading markdown file: {str(e)}")
     else:
         logger.warning(f"Markdown file not found: {markdown_file}")
         # List all files in the data directory for debugging
         try:
-            if os.path.exists(DATA_DIR):
-                files = os.listdir(DATA_DIR)
-                logger.info(f"Files in DATA_DIR: {files}")
+            files = [entry.name for entry in data_manifest.files()]
+            logger.info(f"Files in DATA_DIR: {files}")
         except Exception as e:
             logger.error(f"Error listing files in DATA_DIR: {str(e)}")
     
-    return render_template('index.html', headings=headings)
+    return render_template('index.html', headings=headings,
+                           markdown_render_mode=app.config['MARKDOWN_RENDER_MODE'])
 
 @app.route('/api/files')
 def list_files():
-    """List all available files"""
-    files = []
+    """List all available files.
+
+    Optional query parameters filter and page the listing: prefix, ext
+    (comma-separated extensions), q (case-insensitive substring),
+    recursive=1 to include subdirectories, and offset/limit. The total
+    number of matches is returned in the X-Total-Count header.
+    """
     try:
-        # List files in data directory
-        if os.path.exists(DATA_DIR):
-            for filename in os.listdir(DATA_DIR):
-                file_path = os.path.join(DATA_DIR, filename)
-                if os.path.isfile(file_path):
-                    extension = os.path.splitext(filename)[1]
-                    files.append({
-                        'name': filename,
-                        'type': CONTENT_TYPES.get(extension, 'text/plain'),
-                        'size': os.path.getsize(file_path)
-                    })
-            logger.info(f"Listed {len(files)} files in data directory")
-        else:
-            logger.error(f"DATA_DIR does not exist: {DATA_DIR}")
-            return jsonify({'error': 'Data directory not found'}), 404
+        offset = int(request.args.get('offset', 0))
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    if offset < 0 or (limit is not None and limit < 0):
+        return jsonify({'error': 'offset and limit must not be negative'}), 400
+    
+    prefix = request.args.get('prefix', '')
+    query = request.args.get('q', '').lower()
+    extensions = tuple(
+        ext if ext.startswith('.') else f".{ext}"
+        for ext in request.args.get('ext', '').split(',') if ext
+    )
+    recursive = request.args.get('recursive') in ('1', 'true')
+    
+    try:
+        digest, last_modified, entries = data_manifest.select(prefix, extensions, query, recursive)
+        logger.info(f"Listed {len(entries)} files in data directory")
     except Exception as e:
         logger.error(f"Error listing files: {str(e)}")
         return jsonify({'error': str(e)}), 500
     
-    return jsonify(files)
+    total = len(entries)
+    page = entries[offset:offset + limit] if limit is not None else entries[offset:]
+    etag = etag_for(digest, prefix, query, extensions, recursive, offset, limit)
+    response = conditional_json(etag, last_modified, lambda: [entry.info for entry in page])
+    response.headers['X-Total-Count'] = str(total)
+    return response
+
+@app.route('/api/documents')
+def list_documents():
+    """List the markdown documents below DATA_DIR.
+
+    Each item has the document's id (for /api/markdown/docs/<id>), file name
+    and size; nothing is parsed. prefix, q, offset and limit work as for
+    /api/files, and X-Total-Count has the number of matches.
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    if offset < 0 or (limit is not None and limit < 0):
+        return jsonify({'error': 'offset and limit must not be negative'}), 400
+    
+    prefix = request.args.get('prefix', '')
+    query = request.args.get('q', '').lower()
+    
+    try:
+        digest, last_modified, entries = markdown_documents(prefix, query)
+    except Exception as e:
+        logger.error(f"Error listing documents: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    total = len(entries)
+    page = entries[offset:offset + limit] if limit is not None else entries[offset:]
+    etag = etag_for('documents', digest, app.config['DEFAULT_DOCUMENT'], prefix, query, offset, limit)
+    response = conditional_json(etag, last_modified, lambda: [
+        {'id': document_id(entry), 'name': entry.name, 'size': entry.size,
+         'default': entry.name == find_document()[0]}
+        for entry in page
+    ])
+    response.headers['X-Total-Count'] = str(total)
+    return response
 
 @app.route('/api/markdown')
-def get_markdown():
-    """Get the markdown content with processed headings"""
-    markdown_file = os.path.join(DATA_DIR, 'ai-first.md')
+@app.route('/api/markdown/docs/<path:doc>')
+def get_markdown(doc=None):
+    """Get the markdown content of a document with processed headings.
+
+    The document is /api/markdown/docs/<doc> or ?doc=<doc> (a path below
+    DATA_DIR without .md), DEFAULT_DOCUMENT if neither is given. The other
+    /api/markdown routes and /api/search take ?doc= the same way.
+    ?format=html returns the document fully rendered to HTML instead.
+    """
+    output_format = request.args.get('format', 'markdown')
+    
+    if output_format not in MARKDOWN_FORMATS:
+        return jsonify({'error': f'Unsupported format: {output_format}'}), 400
     
-    if not os.path.isfile(markdown_file):
+    markdown_file, entry = find_document(doc or request.args.get('doc'))
+    if entry is None:
         logger.error(f"Markdown file not found: {markdown_file}")
         return jsonify({'error': 'Markdown file not found'}), 404
     
     try:
-        with open(markdown_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-            processed_content = preprocess_markdown(content)
-            headings = extract_headings(content)
+        document = document_cache.get(entry.path, entry.version)
+        etag = f"{document.digest}-{output_format}"
         
-        logger.info(f"Successfully processed markdown file: {len(content)} characters")
-        return jsonify({
-            'content': processed_content,
-            'headings': headings
+        if output_format == 'html':
+            return conditional_json(etag, document.last_modified, lambda: {
+                'content': document.html,
+                'headings': document.toc,
+                'format': 'html'
+            })
+        return conditional_json(etag, document.last_modified, lambda: {
+            'content': document.processed_content,
+            'headings': document.toc
         })
     except Exception as e:
         logger.error(f"Error reading markdown file: {str(e)}")
         return jsonify({'error': f'Error reading markdown file: {str(e)}'}), 500
 
-def find_mermaid_file(base_name):
-    """Try to find a mermaid file with different extensions"""
-    extensions = ['.mermaid', '.txt']
+@app.route('/api/markdown/stream')
+def stream_markdown():
+    """Stream the markdown content as NDJSON, one record per section.
+
+    Each line is {"id", "text", "level", "content"} for a section (id is
+    null for any text before the first heading), and the last line is
+    {"done": true, "sections": n}. The file is read while the response is
+    sent, so the first section goes out at once and memory does not grow
+    with the document. See stream_markdown_records for long sections.
+    """
+    markdown_file, entry = find_document(request.args.get('doc'))
+    if entry is None:
+        logger.error(f"Markdown file not found: {markdown_file}")
+        return jsonify({'error': 'Markdown file not found'}), 404
+    
+    encoding = negotiate_encoding(('gzip',))
+    etag = variant_etag(etag_for('markdown-stream', entry.version), encoding)
+    cached = not_modified(etag, entry.last_modified)
+    if cached:
+        cached.vary.add('Accept-Encoding')
+        return cached
     
-    for ext in extensions:
-        file_path = os.path.join(DATA_DIR, f"{base_name}{ext}")
-        if os.path.isfile(file_path):
-            return file_path, ext
+    try:
+        f = open(entry.path, 'rb')
+    except OSError as e:
+        logger.error(f"Error reading markdown file: {str(e)}")
+        return jsonify({'error': f'Error reading markdown file: {str(e)}'}), 500
+    
+    def generate():
+        # gzip is flushed after every record, so each one reaches the client
+        # as soon as it is ready
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if encoding else None
+        try:
+            for line in stream_markdown_records(f):
+                data = line.encode('utf-8')
+                if compressor is not None:
+                    data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                yield data
+        except Exception as e:
+            # The status line has gone out already; report in-band
+            logger.error(f"Error streaming markdown file: {str(e)}")
+            data = (json.dumps({'error': f'Error streaming markdown file: {str(e)}'}) + '\n').encode('utf-8')
+            yield compressor.compress(data) if compressor is not None else data
+        finally:
+            f.close()
+        if compressor is not None:
+            yield compressor.flush()
     
-    return None, None
+    response = app.response_class(generate(), mimetype='application/x-ndjson')
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    return with_validators(response, etag, entry.last_modified)
+
+@app.route('/api/markdown/toc')
+def get_markdown_toc():
+    """Get the headings with the byte range of each section"""
+    markdown_file, entry = find_document(request.args.get('doc'))
+    
+    if entry is None:
+        logger.error(f"Markdown file not found: {markdown_file}")
+        return jsonify({'error': 'Markdown file not found'}), 404
+    
+    try:
+        document = document_cache.get(entry.path, entry.version)
+        return conditional_json(f"{document.digest}-toc", document.last_modified, lambda: {
+            'version': document.digest,
+            'size': document.size,
+            'headings': [
+                dict(heading.as_dict(), start=heading.start, end=heading.end)
+                for heading in document.headings
+            ]
+        })
+    except Exception as e:
+        logger.error(f"Error reading markdown file: {str(e)}")
+        return jsonify({'error': f'Error reading markdown file: {str(e)}'}), 500
+
+@app.route('/api/markdown/sections')
+@app.route('/api/markdown/sections/<section_id>')
+def get_markdown_sections(section_id=None):
+    """Get one section by heading id, or a range of sections.
+
+    /api/markdown/sections?from=<id>&to=<id> returns every section from
+    one heading through another (inclusive); either end may be omitted.
+    """
+    markdown_file, entry = find_document(request.args.get('doc'))
+    
+    if entry is None:
+        logger.error(f"Markdown file not found: {markdown_file}")
+        return jsonify({'error': 'Markdown file not found'}), 404
+    
+    try:
+        document = document_cache.get(entry.path, entry.version)
+        
+        if section_id is not None:
+            index = document.heading_index.get(section_id)
+            if index is None:
+                return jsonify({'error': f'Section not found: {section_id}'}), 404
+            return conditional_json(
+                f"{document.digest}-section-{index}",
+                document.last_modified,
+                lambda: document.section_dict(document.headings[index])
+            )
+        
+        first = request.args.get('from')
+        last = request.args.get('to')
+        start = 0 if first is None else document.heading_index.get(first)
+        end = len(document.headings) - 1 if last is None else document.heading_index.get(last)
+        if start is None or end is None:
+            missing = first if start is None else last
+            return jsonify({'error': f'Section not found: {missing}'}), 404
+        
+        return conditional_json(f"{document.digest}-sections-{start}-{end}", document.last_modified, lambda: {
+            'version': document.digest,
+            'sections': [document.section_dict(heading) for heading in document.headings[start:end + 1]]
+        })
+    except Exception as e:
+        logger.error(f"Error reading markdown sections: {str(e)}")
+        return jsonify({'error': f'Error reading markdown sections: {str(e)}'}), 500
+
+@app.route('/api/search')
+def search_markdown():
+    """Full-text search over the sections of the markdown document.
+
+    ?q= is the query and ?limit= the number of results (default 10).
+    Results are ranked sections with their heading id as an anchor and an
+    HTML snippet with the matching words in <mark> tags.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query: q'}), 400
+    try:
+        limit = int(request.args.get('limit', SEARCH_RESULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 0 < limit <= MAX_SEARCH_RESULTS:
+        return jsonify({'error': f'limit must be between 1 and {MAX_SEARCH_RESULTS}'}), 400
+    
+    markdown_file, entry = find_document(request.args.get('doc'))
+    if entry is None:
+        logger.error(f"Markdown file not found: {markdown_file}")
+        return jsonify({'error': 'Markdown file not found'}), 404
+    
+    try:
+        document = document_cache.get(entry.path, entry.version)
+        
+        def build():
+            total, results = search_index.search(document, query, limit)
+            return {'query': query, 'version': document.digest, 'total': total, 'results': results}
+        
+        return conditional_json(etag_for('search', document.digest, query, limit), document.last_modified, build)
+    except Exception as e:
+        logger.error(f"Error searching markdown: {str(e)}")
+        return jsonify({'error': f'Error searching markdown: {str(e)}'}), 500
+
+def send_data_file(entry, mimetype=None):
+    """Serve a data manifest entry with content ETags and precompressed variants"""
+    encoding = precompressed_encoding(entry.path, data_manifest.mtime_ns)
+    etag, last_modified = file_digests.get(entry.path, entry.version)
+    etag = variant_etag(etag, encoding)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        cached.vary.add('Accept-Encoding')
+        return cached
+    response = send_variant(app.config['DATA_DIR'], entry.name, encoding, mimetype=mimetype, etag=etag)
+    response.cache_control.no_cache = True
+    return response
+
+def find_mermaid_file(base_name):
+    """Try to find a mermaid file with different extensions"""
+    entry = data_manifest.find_mermaid(base_name)
+    if entry is None:
+        return None, None
+    return entry.path, os.path.splitext(entry.name)[1]
 
 @app.route('/api/files/<path:filename>')
 def get_file(filename):
@@ -192,35 +2122,247 @@ def get_file(filename):
         # Handle .mermaid file extensions or potential .txt versions
         if filename.endswith('.mermaid'):
             base_name = filename[:-8]  # Remove .mermaid extension
-            file_path, ext = find_mermaid_file(base_name)
+            entry = data_manifest.find_mermaid(base_name)
             
-            if file_path:
-                logger.info(f"Found mermaid file: {file_path}")
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                return content, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+            if entry:
+                logger.info(f"Found mermaid file: {entry.path}")
+                return send_data_file(entry, 'text/plain')
             else:
                 logger.error(f"Mermaid file not found: {filename}")
                 return jsonify({'error': 'Mermaid file not found'}), 404
         
         # For other files, use regular path
         safe_filename = os.path.basename(filename)
-        file_path = os.path.join(DATA_DIR, safe_filename)
+        file_path = os.path.join(app.config['DATA_DIR'], safe_filename)
+        entry = data_manifest.get(safe_filename)
         
-        if not os.path.isfile(file_path):
+        if entry is None:
             logger.error(f"File not found: {file_path}")
             return jsonify({'error': 'File not found'}), 404
         
         extension = os.path.splitext(safe_filename)[1]
         content_type = CONTENT_TYPES.get(extension, 'text/plain')
         
-        return send_from_directory(DATA_DIR, safe_filename, mimetype=content_type)
+        return send_data_file(entry, content_type)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error serving file {filename}: {str(e)}")
         return jsonify({'error': f'Error serving file: {str(e)}'}), 500
 
-@app.route('/static/<path:filename>')
+def send_static_file(directory, filename):
+    """Serve a static file, or its precompressed sibling when the client accepts it"""
+    file_path = safe_join(directory, filename)
+    encoding = precompressed_encoding(file_path) if file_path and os.path.isfile(file_path) else None
+    return send_variant(directory, filename, encoding)
+
+# Fingerprinted asset URLs: templates link /assets/js/app.<hash>.js through
+# asset_url(), and as the URL changes whenever the content does, browsers
+# may keep the file for a year without revalidating it
+ASSET_HASH_LENGTH = 12
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+ASSET_NAME_RE = re.compile(r'^(.*)\.([0-9a-f]{%d})(\.[^./]+)?$' % ASSET_HASH_LENGTH)
+
+class AssetManifest:
+    """Maps files in STATIC_DIR to content-hashed names (js/app.js -> js/app.3f2a9c01b7de.js).
+
+    Digests come from file_digests, so a name costs one stat call and a
+    file is only hashed again after it changes. A hashed name carries its
+    source name, which makes resolve() work in any worker without shared
+    state.
+    """
+
+    def hashed_name(self, filename):
+        """Hashed name for a static file; raises OSError if it does not exist"""
+        path = safe_join(app.config['STATIC_DIR'], filename)
+        if path is None:
+            raise FileNotFoundError(filename)
+        digest, _ = file_digests.get(path)
+        stem, extension = os.path.splitext(filename)
+        return f"{stem}.{digest[:ASSET_HASH_LENGTH]}{extension}"
+
+    def resolve(self, hashed_name):
+        """(static filename, whether hashed_name matches its current content), or (None, False)"""
+        match = ASSET_NAME_RE.match(hashed_name)
+        if match is None:
+            return None, False
+        filename = match.group(1) + (match.group(3) or '')
+        try:
+            return filename, self.hashed_name(filename) == hashed_name
+        except OSError:
+            return None, False
+
+    def build(self):
+        """Hashed names of every static file (precompressed siblings excluded)"""
+        names = {}
+        static_dir = app.config['STATIC_DIR']
+        for root, dirs, files in os.walk(static_dir):
+            dirs.sort()
+            for file in sorted(files):
+                if file.endswith(PRECOMPRESSED_SUFFIXES):
+                    continue
+                filename = os.path.relpath(os.path.join(root, file), static_dir).replace(os.sep, '/')
+                try:
+                    names[filename] = self.hashed_name(filename)
+                except OSError as e:
+                    logger.error(f"Error hashing static file {filename}: {str(e)}")
+        return names
+
+asset_manifest = AssetManifest()
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file that changes with its content, for templates.
+
+    Falls back to the plain /static URL if the file cannot be read, so a
+    missing asset breaks one tag rather than the page.
+    """
+    try:
+        return url_for('asset', filename=asset_manifest.hashed_name(filename))
+    except OSError as e:
+        logger.error(f"Error fingerprinting asset {filename}: {str(e)}")
+        return url_for('static', filename=filename)
+
+@app.route('/assets/<path:filename>', endpoint='asset')
+def serve_asset(filename):
+    """Serve a fingerprinted static file with far-future immutable caching"""
+    try:
+        source, current = asset_manifest.resolve(filename)
+        if source is None:
+            return jsonify({'error': 'Asset not found'}), 404
+        if not current:
+            # A page from before the file changed: point it at the current version
+            return redirect(url_for('asset', filename=asset_manifest.hashed_name(source)))
+        response = send_static_file(app.config['STATIC_DIR'], source)
+        # send_file asks for revalidation unless given a max age
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error serving asset {filename}: {str(e)}")
+        return jsonify({'error': f'Error serving asset: {str(e)}'}), 500
+
+# Local stylesheets and scripts of the index page, in template order. Each
+# list is served as one minified file; executive-summary.js is left out
+# because it is an ES module, which app.js loads on demand.
+ASSET_BUNDLES = {
+    'index.css': ['css/dark-theme.css', 'css/toc-fixes.css', 'css/chart-overrides.css'],
+    'index.js': ['js/markdown-renderer.js', 'js/fixed-toc-height.js', 'js/tab-navigation-fix.js', 'js/app.js',
+                 'js/theme-toggle.js', 'js/sources-integration.js', 'js/unified-mermaid.js'],
+}
+# Between scripts: a newline ends a trailing // comment, and the semicolon
+# keeps a file ending without one from running into the next
+BUNDLE_SEPARATORS = {'.js': '\n;\n', '.css': '\n'}
+
+def minify_asset(text, extension):
+    if extension == '.js' and rjsmin is not None:
+        return rjsmin.jsmin(text)
+    if extension == '.css' and rcssmin is not None:
+        return rcssmin.cssmin(text)
+    return text
+
+class AssetBundle:
+    """Static files joined and minified into one body, kept in memory.
+
+    Rebuilt when the stat of any source changes, so edits show up on the
+    next request. Compressed copies are made once per build.
+    """
+
+    def __init__(self, name, sources):
+        self.name = name
+        self.sources = sources
+        self._lock = threading.Lock()
+        # (source versions, hashed name, {encoding or None: body})
+        self._built = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        """(hashed name, bodies by encoding) for the current sources; raises OSError"""
+        static_dir = app.config['STATIC_DIR']
+        versions = tuple(file_version(os.stat(os.path.join(static_dir, filename))) for filename in self.sources)
+        built = self._built
+        if built is not None and built[0] == versions:
+            self.hits += 1
+            return built[1], built[2]
+        with self._lock:
+            if self._built is None or self._built[0] != versions:
+                self.misses += 1
+                self._built = (versions,) + self._build()
+            return self._built[1], self._built[2]
+
+    def _build(self):
+        started = time.perf_counter()
+        stem, extension = os.path.splitext(self.name)
+        parts = []
+        for filename in self.sources:
+            with open(os.path.join(app.config['STATIC_DIR'], filename), encoding='utf-8') as f:
+                parts.append(minify_asset(f.read(), extension))
+        data = BUNDLE_SEPARATORS.get(extension, '\n').join(parts).encode('utf-8')
+        digest = hashlib.sha1(data).hexdigest()
+        bodies = {None: data}
+        for encoding in AVAILABLE_ENCODINGS:
+            bodies[encoding] = compress(data, encoding, best=True)
+        logger.info(f"Built bundle {self.name}: {len(self.sources)} files, {len(data)} bytes "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return f"{stem}.{digest[:ASSET_HASH_LENGTH]}{extension}", bodies
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+asset_bundles = {name: AssetBundle(name, sources) for name, sources in ASSET_BUNDLES.items()}
+
+def bundling_enabled():
+    mode = app.config['BUNDLE_ASSETS']
+    return mode == 'on' or (mode == 'auto' and not app.debug)
+
+@app.template_global()
+def bundle_urls(name):
+    """URLs a template links for an entry of ASSET_BUNDLES: the bundle, or its files one by one"""
+    if bundling_enabled():
+        try:
+            return [url_for('bundle', filename=asset_bundles[name].get()[0])]
+        except OSError as e:
+            logger.error(f"Error building bundle {name}: {str(e)}")
+    return [asset_url(filename) for filename in ASSET_BUNDLES[name]]
+
+@app.route('/assets/bundles/<filename>', endpoint='bundle')
+def serve_bundle(filename):
+    """Serve a fingerprinted bundle from memory with far-future immutable caching"""
+    try:
+        match = ASSET_NAME_RE.match(filename)
+        bundle = asset_bundles.get(match.group(1) + (match.group(3) or '')) if match else None
+        if bundle is None:
+            return jsonify({'error': 'Bundle not found'}), 404
+        hashed_name, bodies = bundle.get()
+        if hashed_name != filename:
+            return redirect(url_for('bundle', filename=hashed_name))
+        encoding = negotiate_encoding()
+        response = app.response_class(bodies[encoding], mimetype=mimetypes.guess_type(filename)[0])
+        response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(variant_etag(hashed_name, encoding))
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+        return response.make_conditional(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error serving bundle {filename}: {str(e)}")
+        return jsonify({'error': f'Error serving bundle: {str(e)}'}), 500
+
+@app.cli.command('assets')
+def assets_command():
+    """Print the asset manifest: each static file and its fingerprinted name"""
+    click.echo(json.dumps(asset_manifest.build(), indent=2))
+
+@app.route('/static/<path:filename>', endpoint='static')
 def serve_static(filename):
     """Explicitly serve static files"""
     try:
@@ -233,13 +2375,15 @@ def serve_static(filename):
             subpath = filename[4:]  # Remove 'css/' prefix
         else:
             # Serve directly from static folder
-            return send_from_directory(STATIC_DIR, filename)
+            return send_static_file(app.config['STATIC_DIR'], filename)
         
         # Serve from the appropriate subdirectory
-        subdir_path = os.path.join(STATIC_DIR, subdir)
+        subdir_path = os.path.join(app.config['STATIC_DIR'], subdir)
         logger.info(f"Serving static file from {subdir}: {subpath}")
-        return send_from_directory(subdir_path, subpath)
+        return send_static_file(subdir_path, subpath)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error serving static file {filename}: {str(e)}")
         return jsonify({'error': f'Error serving static file: {str(e)}'}), 500
@@ -248,7 +2392,13 @@ def serve_static(filename):
 def serve_data_file(filename):
     """Directly serve files from the data directory"""
     try:
-        return send_from_directory(DATA_DIR, filename)
+        entry = data_manifest.get(filename)
+        if entry is None:
+            return send_from_directory(app.config['DATA_DIR'], filename)
+        
+        return send_data_file(entry)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error serving data file {filename}: {str(e)}")
         return jsonify({'error': f'Error serving data file: {str(e)}'}), 500
@@ -280,9 +2430,7 @@ def list_diagrams():
         diagrams = []
         
         # Try to find diagrams with either .mermaid or .txt extension
-        diagram_bases = ['traditional-workflow', 'ai-assisted-workflow', 'ai-first-workflow']
-        
-        for base_name in diagram_bases:
+        for base_name in DIAGRAM_BASE_NAMES:
             file_path, ext = find_mermaid_file(base_name)
             if file_path:
                 # Extract name from base_name
@@ -313,38 +2461,98 @@ def list_diagrams():
             {'name': 'AI-First Workflow', 'file': 'ai-first-workflow.mermaid'}
         ]
     
-    return jsonify(diagrams)
+    etag = etag_for([(diagram['name'], diagram['file']) for diagram in diagrams])
+    return conditional_json(etag, None, lambda: diagrams)
+
+@app.route('/api/diagrams/bundle')
+def get_diagram_bundle():
+    """Get the source of several Mermaid diagrams in one response.
+
+    ?names=a,b selects diagrams by base name (a .mermaid or .txt extension
+    is ignored); without it every workflow diagram is included.
+    """
+    names = request.args.get('names')
+    if names:
+        base_names = []
+        for name in names.split(','):
+            name = name.strip()
+            for ext in ('.mermaid', '.txt'):
+                if name.endswith(ext):
+                    name = name[:-len(ext)]
+            if name and name not in base_names:
+                base_names.append(name)
+    else:
+        base_names = DIAGRAM_BASE_NAMES
+    
+    if len(base_names) > MAX_BUNDLE_DIAGRAMS:
+        return jsonify({'error': f'Too many diagrams requested (max {MAX_BUNDLE_DIAGRAMS})'}), 400
+    
+    found = []
+    missing = []
+    try:
+        for base_name in base_names:
+            entry = data_manifest.find_mermaid(base_name)
+            if entry is None:
+                missing.append(base_name)
+                continue
+            digest, last_modified = file_digests.get(entry.path, entry.version)
+            found.append((base_name, entry.path, digest, last_modified))
+    except Exception as e:
+        logger.error(f"Error loading diagram bundle: {str(e)}")
+        return jsonify({'error': f'Error loading diagram bundle: {str(e)}'}), 500
+    
+    def build():
+        diagrams = {}
+        for base_name, file_path, digest, last_modified in found:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                diagrams[base_name] = {'file': os.path.basename(file_path), 'content': f.read()}
+        return {'diagrams': diagrams, 'missing': missing}
+    
+    etag = etag_for('diagram-bundle', [(entry[0], entry[1], entry[2]) for entry in found], missing)
+    last_modified = max(entry[3] for entry in found) if found else None
+    return conditional_json(etag, last_modified, build)
+
+@app.route('/metrics')
+def get_metrics():
+    """Request and cache metrics of every worker in the Prometheus text format"""
+    totals = metrics_registry.collect()
+    for name in cache_stats():
+        hits = totals.get(metrics.sample_key('cache_hits_total', ('cache',), (name,)), 0.0)
+        misses = totals.get(metrics.sample_key('cache_misses_total', ('cache',), (name,)), 0.0)
+        if hits + misses:
+            totals[metrics.sample_key('cache_hit_ratio', ('cache',), (name,))] = hits / (hits + misses)
+    return app.response_class(metrics_registry.render(totals), mimetype='text/plain; version=0.0.4')
 
 @app.route('/check_file_access')
 def check_file_access():
     """Debug endpoint to check file access permissions"""
     results = {
-        "base_dir": BASE_DIR,
-        "data_dir": DATA_DIR,
-        "static_dir": STATIC_DIR,
-        "template_dir": TEMPLATE_DIR,
-        "data_dir_exists": os.path.exists(DATA_DIR),
-        "static_dir_exists": os.path.exists(STATIC_DIR),
-        "template_dir_exists": os.path.exists(TEMPLATE_DIR),
+        "base_dir": app.config['BASE_DIR'],
+        "data_dir": app.config['DATA_DIR'],
+        "static_dir": app.config['STATIC_DIR'],
+        "template_dir": app.config['TEMPLATE_DIR'],
+        "data_dir_exists": os.path.exists(app.config['DATA_DIR']),
+        "static_dir_exists": os.path.exists(app.config['STATIC_DIR']),
+        "template_dir_exists": os.path.exists(app.config['TEMPLATE_DIR']),
         "data_files": [],
         "static_dirs": [],
         "template_files": []
     }
     
     # Check data files
-    if os.path.exists(DATA_DIR):
-        try:
-            results["data_files"] = os.listdir(DATA_DIR)
-        except Exception as e:
-            results["data_files_error"] = str(e)
+    try:
+        results["data_files"] = [entry.name for entry in data_manifest.files()]
+        results["data_manifest"] = data_manifest.stats()
+    except Exception as e:
+        results["data_files_error"] = str(e)
     
     # Check static directories
-    if os.path.exists(STATIC_DIR):
+    if os.path.exists(app.config['STATIC_DIR']):
         try:
-            results["static_dirs"] = os.listdir(STATIC_DIR)
+            results["static_dirs"] = os.listdir(app.config['STATIC_DIR'])
             # Check js and css subdirectories
-            js_dir = os.path.join(STATIC_DIR, 'js')
-            css_dir = os.path.join(STATIC_DIR, 'css')
+            js_dir = os.path.join(app.config['STATIC_DIR'], 'js')
+            css_dir = os.path.join(app.config['STATIC_DIR'], 'css')
             if os.path.exists(js_dir):
                 results["js_files"] = os.listdir(js_dir)
             if os.path.exists(css_dir):
@@ -353,30 +2561,38 @@ def check_file_access():
             results["static_dirs_error"] = str(e)
     
     # Check template files
-    if os.path.exists(TEMPLATE_DIR):
+    if os.path.exists(app.config['TEMPLATE_DIR']):
         try:
-            results["template_files"] = os.listdir(TEMPLATE_DIR)
+            results["template_files"] = os.listdir(app.config['TEMPLATE_DIR'])
         except Exception as e:
             results["template_files_error"] = str(e)
     
     # Check specific files
     try:
-        md_file = os.path.join(DATA_DIR, 'ai-first.md')
-        results["md_file_exists"] = os.path.exists(md_file)
-        if os.path.exists(md_file):
-            results["md_file_size"] = os.path.getsize(md_file)
-            results["md_file_readable"] = os.access(md_file, os.R_OK)
+        markdown_file, md_entry = find_document()
+        results["md_file"] = markdown_file
+        results["md_file_exists"] = md_entry is not None
+        if md_entry is not None:
+            results["md_file_size"] = md_entry.size
+            results["md_file_readable"] = os.access(md_entry.path, os.R_OK)
     except Exception as e:
         results["md_file_error"] = str(e)
     
+    try:
+        results["markdown_documents"] = len(markdown_documents()[2])
+    except Exception as e:
+        results["markdown_documents_error"] = str(e)
+    results["document_cache"] = document_cache.stats()
+    results["search_index"] = search_index.stats()
+    
     # Check mermaid files
-    for base_name in ['traditional-workflow', 'ai-assisted-workflow', 'ai-first-workflow']:
+    for base_name in DIAGRAM_BASE_NAMES:
         file_path, ext = find_mermaid_file(base_name)
         if file_path:
             try:
                 results[f"{base_name}_exists"] = True
                 results[f"{base_name}_extension"] = ext
-                results[f"{base_name}_size"] = os.path.getsize(file_path)
+                results[f"{base_name}_size"] = data_manifest.find_mermaid(base_name).size
                 results[f"{base_name}_readable"] = os.access(file_path, os.R_OK)
                 # Read first 100 chars
                 with open(file_path, 'r', encoding='utf-8') as f:
@@ -393,7 +2609,7 @@ def test_mermaid():
     """Test endpoint to directly show mermaid files content"""
     results = {}
     
-    for base_name in ['traditional-workflow', 'ai-assisted-workflow', 'ai-first-workflow']:
+    for base_name in DIAGRAM_BASE_NAMES:
         file_path, ext = find_mermaid_file(base_name)
         if file_path:
             try:
@@ -423,5 +2639,114 @@ def server_error(e):
     logger.error(traceback.format_exc())
     return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
+def warm_caches():
+    """Do the per-process setup that would otherwise fall on the first requests.
+
+    Scans DATA_DIR, parses, indexes (and in server render mode renders)
+    the default markdown document (the others are parsed when requested),
+    digests the diagram and static files, builds the asset bundles and
+    renders the index page into page_cache. Run before forking (gunicorn
+    preload_app), the results are shared copy-on-write by every worker.
+    """
+    started = time.perf_counter()
+    for manifest in (data_manifest, template_manifest, static_manifest):
+        manifest.start()
+    entry = find_document()[1]
+    if entry is not None:
+        document = document_cache.get(entry.path, entry.version)
+        search_index.index(document)
+        if app.config['MARKDOWN_RENDER_MODE'] == 'server':
+            document.html
+    for base_name in DIAGRAM_BASE_NAMES:
+        diagram = data_manifest.find_mermaid(base_name)
+        if diagram is not None:
+            file_digests.get(diagram.path, diagram.version)
+    asset_manifest.build()
+    if bundling_enabled():
+        for bundle in asset_bundles.values():
+            bundle.get()
+    with app.test_request_context('/'):
+        index()
+    logger.info(f"Caches warmed in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+def create_app(config=None):
+    """Configure the app, start its subsystems and return it.
+
+    config maps names from CONFIG_KEYS to values that replace the module
+    defaults, e.g. create_app({'DATA_DIR': '/srv/portal/data', 'LOG_MODE':
+    'off'}); DATA_DIR, STATIC_DIR and TEMPLATE_DIR follow BASE_DIR unless
+    given. The settings go into app.config. The app and its caches exist
+    once per process, so calling this again returns the same app if the
+    settings match and raises RuntimeError if they differ. Unknown keys
+    and unknown modes raise ValueError. Importing this module does no I/O:
+    logging, the data directory and the metrics store are set up here, and
+    with WARM_UP every cache is built before the app is returned, so the
+    first request is served warm. Entry point for gunicorn.conf.py, asgi.py
+    and `python app.py`.
+    """
+    global data_manifest, template_manifest, static_manifest, response_bodies, created_config
+    started = time.perf_counter()
+    config = dict(config or {})
+    unknown = set(config) - set(CONFIG_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown config keys: {', '.join(sorted(unknown))}")
+    if 'BASE_DIR' in config:
+        for key, name in (('DATA_DIR', 'data'), ('STATIC_DIR', 'static'), ('TEMPLATE_DIR', 'templates')):
+            config.setdefault(key, os.path.join(config['BASE_DIR'], name))
+    settings = {key: globals()[key] for key in CONFIG_KEYS}
+    settings.update(config)
+    for key, choices in CONFIG_CHOICES.items():
+        if settings[key] not in choices:
+            raise ValueError(f"Invalid {key} {settings[key]!r}; expected one of {', '.join(choices)}")
+    if created_config is not None:
+        if settings != created_config:
+            changed = sorted(key for key in CONFIG_KEYS if settings[key] != created_config[key])
+            raise RuntimeError(f"create_app() was already called with other settings for {', '.join(changed)}; "
+                               "the app is configured once per process")
+        return app
+    created_config = settings
+    app.config.update(settings)
+    config = app.config
+
+    configure_logging(config['LOG_MODE'], config['LOG_FILE'])
+    for key in ('BASE_DIR', 'DATA_DIR', 'STATIC_DIR', 'TEMPLATE_DIR'):
+        logger.info(f"{key}: {config[key]}")
+    try:
+        os.makedirs(config['DATA_DIR'], exist_ok=True)
+    except Exception as e:
+        logger.error(f"Failed to create DATA_DIR: {str(e)}")
+
+    if os.path.join(app.root_path, app.template_folder) != config['TEMPLATE_DIR']:
+        app.template_folder = config['TEMPLATE_DIR']
+        # Flask caches the loader for the old folder
+        app.__dict__.pop('jinja_loader', None)
+        if 'jinja_env' in app.__dict__:
+            app.jinja_env.cache.clear()
+    app.jinja_env.bytecode_cache = None
+    template_cache_dir = config['TEMPLATE_CACHE_DIR']
+    if template_cache_dir != 'off':
+        try:
+            # Jinja creates its default directory, but not one it is given
+            if template_cache_dir is not None:
+                os.makedirs(template_cache_dir, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(template_cache_dir)
+        except (OSError, RuntimeError) as e:
+            # RuntimeError: Jinja found its default directory unsafe to use
+            logger.warning(f"Template bytecode cache disabled: {str(e)}")
+    page_cache.clear()
+    document_cache.max_bytes = config['DOCUMENT_CACHE_MAX_BYTES']
+    data_manifest = configured_manifest(data_manifest, config['DATA_DIR'], on_change=data_changed)
+    template_manifest = configured_manifest(template_manifest, config['TEMPLATE_DIR'])
+    static_manifest = configured_manifest(static_manifest, config['STATIC_DIR'])
+    metrics_registry.set_directory(config['METRICS_DIR'])
+    response_bodies = cache.create(config['CACHE_BACKEND'], max_bytes=config['CACHE_MAX_BYTES'], ttl=config['CACHE_TTL'],
+                                   directory=config['CACHE_DIR'], url=config['CACHE_URL'])
+    logger.info(f"Response cache: {config['CACHE_BACKEND']}")
+
+    if config['WARM_UP']:
+        warm_caches()
+    logger.info(f"App created in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    create_app().run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+ASGI Server
+
+Serves the Flask app in app.py over ASGI, for example with uvicorn:
+
+    uvicorn asgi:application --port 5000
+    GUNICORN_PRESET=asgi gunicorn
+
+Flask still does all routing, validation and headers (ETags, 304s,
+precompressed variants). Each request runs its view on a small thread
+pool, but only until the response object exists. The body is then sent
+from the event loop. Files served through send_from_directory (/static,
+/data, /api/files) are read in chunks off the loop. In-memory bodies such
+as /api/markdown are written as fast as the client takes them. A slow
+client therefore holds a socket, not a thread, so a handful of threads can
+serve hundreds of connections.
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app, create_app
+
+# Threads that run Flask views and read file chunks
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', '8'))
+CHUNK_SIZE = 64 * 1024
+# Response headers the ASGI server adds itself, dropped from the app's
+SERVER_HEADERS = ('date',)
+
+class AsyncFileWrapper:
+    """wsgi.file_wrapper that lets the ASGI side read the file itself"""
+
+    def __init__(self, file, buffer_size=CHUNK_SIZE):
+        self.file = file
+        self.buffer_size = buffer_size
+
+    def __iter__(self):
+        # Plain WSGI iteration, for anything that does not know this class
+        return iter(lambda: self.file.read(self.buffer_size), b'')
+
+    def close(self):
+        self.file.close()
+
+def build_environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': AsyncFileWrapper,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+class ASGIApplication:
+    """ASGI callable around a WSGI app; see the module docstring"""
+
+    def __init__(self, wsgi_app, threads=ASGI_THREADS, setup=None):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        # Called on lifespan startup, e.g. app.create_app
+        self.setup = setup
+        self._executor = None
+
+    @property
+    def executor(self):
+        # Created on first use, so a server that forks after import does not
+        # inherit a pool whose threads only exist in the parent
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi')
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise NotImplementedError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    if self.setup is not None:
+                        await loop.run_in_executor(self.executor, self.setup)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        # Stop sending as soon as the client goes away
+        disconnected = asyncio.ensure_future(receive())
+
+        loop = asyncio.get_running_loop()
+        status, headers, first, iterable = await loop.run_in_executor(
+            self.executor, self.run_wsgi, build_environ(scope, b''.join(body)))
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            if first:
+                await send({'type': 'http.response.body', 'body': first, 'more_body': True})
+            if isinstance(iterable, AsyncFileWrapper):
+                read = iterable.file.read
+                while not disconnected.done():
+                    chunk = await loop.run_in_executor(self.executor, read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            elif iterable is not None:
+                iterator = iter(iterable)
+                while not disconnected.done():
+                    chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+                    if chunk is None:
+                        break
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            disconnected.cancel()
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, close)
+
+    def run_wsgi(self, environ):
+        """Call the WSGI app in a pool thread.
+
+        Returns (status, headers, first chunk, rest). For file responses the
+        rest is the AsyncFileWrapper itself and nothing has been read yet;
+        otherwise the first chunk is pulled here, which for in-memory
+        bodies is the whole body.
+        """
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            # The ASGI server sends its own Date header
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers if name.lower() not in SERVER_HEADERS]
+            return lambda data: None
+
+        iterable = self.wsgi_app(environ, start_response)
+        if isinstance(iterable, AsyncFileWrapper):
+            return started['status'], started['headers'], b'', iterable
+
+        iterator = iter(iterable)
+        # start_response may legally be deferred until the first chunk (PEP 3333)
+        first = next(iterator, b'')
+        return started['status'], started['headers'], first, IterableWithClose(iterator, iterable)
+
+class IterableWithClose:
+    """The remaining chunks of a WSGI response, keeping the original close()"""
+
+    def __init__(self, iterator, iterable):
+        self.iterator = iterator
+        self.iterable = iterable
+
+    def __iter__(self):
+        return self.iterator
+
+    def close(self):
+        close = getattr(self.iterable, 'close', None)
+        if close is not None:
+            close()
+
+def create_application():
+    """Entry point for gunicorn (preload): the ASGI app, already created and warmed"""
+    return ASGIApplication(create_app())
+
+# For `uvicorn asgi:application`, which creates the app on lifespan startup
+application = ASGIApplication(flask_app, setup=create_app)
@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+"""
+Benchmarks
+
+Micro-benchmarks for the document pipeline in app.py, run against the real
+files in the data directory.
+
+Usage:
+    python benchmark.py markdown [--repeat N]
+    python benchmark.py logging [--requests N]
+    python benchmark.py routes [--server inprocess|gunicorn] [--preset P] [--concurrency C]
+                               [--requests N] [--save-baseline | --check]
+    python benchmark.py slow-clients [--clients N] [--path P]
+    python benchmark.py stream [--sizes MB,...]
+    python benchmark.py render [--repeat N]
+    python benchmark.py startup [--server inprocess|gunicorn] [--save-baseline | --check]
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from contextlib import contextmanager
+
+import app
+
+MARKDOWN_FILE = os.path.join(app.app.config['DATA_DIR'], 'ai-first.md')
+
+# The two-pass implementation that compile_markdown replaced, kept here as
+# the reference point for the markdown benchmark
+def legacy_extract_headings(markdown_text):
+    headings = []
+    for line in markdown_text.split('\n'):
+        if line.startswith('## '):
+            heading_text = line[3:].strip()
+            level = 2
+        elif line.startswith('### '):
+            heading_text = line[4:].strip()
+            level = 3
+        else:
+            continue
+        heading_id = heading_text.lower().replace(' ', '-').replace(':', '').replace(',', '')
+        heading_id = re.sub(r'[^a-z0-9-]', '', heading_id)
+        headings.append({'text': heading_text, 'id': heading_id, 'level': level})
+    return headings
+
+def legacy_preprocess_markdown(markdown_text):
+    processed_lines = []
+    for line in markdown_text.split('\n'):
+        if line.startswith('## '):
+            heading_text = line[3:].strip()
+            heading_id = heading_text.lower().replace(' ', '-').replace(':', '').replace(',', '')
+            heading_id = re.sub(r'[^a-z0-9-]', '', heading_id)
+            processed_lines.append(f'<h2 id="{heading_id}" class="{app.HEADING_CLASSES[2]}">{heading_text}</h2>')
+        elif line.startswith('### '):
+            heading_text = line[4:].strip()
+            heading_id = heading_text.lower().replace(' ', '-').replace(':', '').replace(',', '')
+            heading_id = re.sub(r'[^a-z0-9-]', '', heading_id)
+            processed_lines.append(f'<h3 id="{heading_id}" class="{app.HEADING_CLASSES[3]}">{heading_text}</h3>')
+        else:
+            processed_lines.append(line)
+    return '\n'.join(processed_lines)
+
+def report(name, seconds, repeat, baseline=None):
+    per_call = seconds / repeat * 1000
+    line = f"{name:<32} {per_call:9.3f} ms/call"
+    if baseline:
+        line += f"  ({baseline / seconds:.1f}x)"
+    print(line)
+
+def bench_markdown(args):
+    with open(MARKDOWN_FILE, 'rb') as f:
+        raw = f.read()
+    text = raw.decode('utf-8')
+
+    # Both paths must agree before their timings mean anything
+    document = app.compile_markdown(raw)
+    assert document.processed_content == legacy_preprocess_markdown(text)
+    assert document.toc == legacy_extract_headings(text)
+
+    print(f"{MARKDOWN_FILE}: {len(raw)} bytes, {len(document.headings)} headings")
+    legacy = timeit.timeit(
+        lambda: (legacy_preprocess_markdown(text), legacy_extract_headings(text)),
+        number=args.repeat
+    )
+    report('legacy two-pass', legacy, args.repeat)
+    report('compile_markdown', timeit.timeit(lambda: app.compile_markdown(raw), number=args.repeat),
+           args.repeat, legacy)
+
+    report('render_markdown_html', timeit.timeit(lambda: app.render_markdown_html(document), number=args.repeat),
+           args.repeat)
+
+    app.document_cache.get(MARKDOWN_FILE)
+    report('document_cache.get (warm)', timeit.timeit(lambda: app.document_cache.get(MARKDOWN_FILE),
+                                                      number=args.repeat), args.repeat, legacy)
+
+# The requests of one page load
+PAGE_LOAD_URLS = ['/', '/api/markdown', '/api/files', '/api/diagrams', '/api/diagrams/bundle',
+                  '/static/js/app.js', '/static/js/unified-mermaid.js', '/static/css/dark-theme.css']
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def slow_down_log_writes(delay):
+    """Make every log file write take at least delay seconds, like a busy or network disk"""
+    handlers = app.log_listener.handlers if app.log_listener is not None else logging.getLogger().handlers
+    for handler in handlers:
+        if isinstance(handler, logging.FileHandler):
+            emit = handler.emit
+            handler.emit = lambda record, emit=emit: (time.sleep(delay), emit(record))
+
+def bench_logging(args):
+    client = app.app.test_client()
+    with tempfile.TemporaryDirectory() as directory:
+        # Warm every cache first so the modes are compared on equal terms
+        app.configure_logging('off', console=False)
+        for _ in range(50):
+            for url in PAGE_LOAD_URLS:
+                client.get(url)
+
+        for mode in ('off', 'sync', 'async'):
+            app.configure_logging(mode, os.path.join(directory, f"{mode}.log"), console=False)
+            if args.write_delay:
+                slow_down_log_writes(args.write_delay / 1000)
+
+            samples = []
+            for _ in range(args.requests // len(PAGE_LOAD_URLS)):
+                for url in PAGE_LOAD_URLS:
+                    start = time.perf_counter()
+                    client.get(url)
+                    samples.append(time.perf_counter() - start)
+            app.stop_logging()
+            print(f"logging {mode:<6} mean {statistics.mean(samples) * 1000:7.3f} ms"
+                  f"  p95 {percentile(samples, 0.95) * 1000:7.3f} ms  ({len(samples)} requests)")
+    app.configure_logging()
+
+# Sample URLs for routes with parameters (or required query strings).
+# Routes whose URLs depend on file contents get theirs in route_urls();
+# route_urls() refuses to run while a route with parameters has none.
+ROUTE_SAMPLES = {
+    '/api/files/<path:filename>': ['/api/files/ai-first-workflow.mermaid'],
+    '/static/<path:filename>': ['/static/js/app.js', '/static/css/dark-theme.css'],
+    '/data/<path:filename>': ['/data/ai-first.md'],
+    '/api/search': ['/api/search?q=ai+workflow'],
+    '/api/markdown': ['/api/markdown', '/api/markdown?format=html'],
+    '/api/markdown/docs/<path:doc>': ['/api/markdown/docs/ai-first'],
+    '/api/files': ['/api/files', '/api/files?recursive=1&q=work'],
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-baseline.json')
+
+def route_urls():
+    """One or more concrete URLs for every GET route of the app"""
+    document = app.document_cache.get(MARKDOWN_FILE)
+    samples = dict(ROUTE_SAMPLES)
+    samples['/api/markdown/sections/<section_id>'] = [f"/api/markdown/sections/{document.headings[0].id}"]
+    samples['/assets/<path:filename>'] = [f"/assets/{app.asset_manifest.hashed_name('js/app.js')}"]
+    samples['/assets/bundles/<filename>'] = [f"/assets/bundles/{bundle.get()[0]}"
+                                             for bundle in app.asset_bundles.values()]
+    urls = []
+    missing = []
+    for rule in sorted(app.app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if 'GET' not in rule.methods:
+            continue
+        if rule.rule in samples:
+            urls.extend(url for url in samples[rule.rule] if url not in urls)
+        elif rule.arguments:
+            missing.append(rule.rule)
+        elif rule.rule not in urls:
+            urls.append(rule.rule)
+    if missing:
+        raise SystemExit(f"No sample URL for {', '.join(missing)}; add one to ROUTE_SAMPLES")
+    return urls
+
+def run_load(fetch, url, requests, concurrency):
+    """Issue requests GETs of url from concurrency threads; returns (latencies, errors, seconds)"""
+    latencies = []
+    errors = []
+    remaining = [requests]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                status = fetch(url)
+            except (OSError, http.client.HTTPException) as e:
+                status = str(e)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not isinstance(status, int) or status >= 500:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+def in_process_fetcher():
+    """fetch(url) through a Flask test client per thread"""
+    local = threading.local()
+
+    def fetch(url):
+        if not hasattr(local, 'client'):
+            local.client = app.app.test_client()
+        response = local.client.get(url)
+        response.close()
+        return response.status_code
+    return fetch
+
+def socket_fetcher(port):
+    """fetch(url) over a real TCP connection per request"""
+    def fetch(url):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            connection.request('GET', url, headers={'Accept-Encoding': 'gzip'})
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+    return fetch
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def gunicorn_server(directory, preset, workers=None, poll_interval=0.2, **settings):
+    """Run the app under gunicorn.conf.py on a free local port; yields the port.
+
+    The port is yielded once a request succeeds, polled every poll_interval
+    seconds. settings are extra environment variables, e.g. GUNICORN_THREADS.
+    """
+    port = free_port()
+    base_dir = os.path.dirname(os.path.abspath(app.__file__))
+    env = dict(os.environ, PYTHONPATH=base_dir, LOG_FILE=os.path.join(directory, 'app.log'),
+               GUNICORN_PRESET=preset, GUNICORN_BIND=f"127.0.0.1:{port}",
+               METRICS_DIR=os.path.join(directory, 'metrics'), **settings)
+    if workers is not None:
+        env['GUNICORN_WORKERS'] = str(workers)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(base_dir, 'gunicorn.conf.py')],
+        cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+            try:
+                socket_fetcher(port)('/api/files')
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start within 30 seconds')
+                time.sleep(poll_interval)
+        yield port
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def summarize(latencies, errors, seconds):
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'rps': len(latencies) / seconds
+    }
+
+def best_round(rounds):
+    """Best figures across rounds, so a noisy round (GC, other processes) does not count"""
+    best = dict(min(rounds, key=lambda result: result['p50']))
+    for field in ('p50', 'p95', 'p99'):
+        best[field] = min(result[field] for result in rounds)
+    best['rps'] = max(result['rps'] for result in rounds)
+    best['errors'] = max(result['errors'] for result in rounds)
+    return best
+
+def regressions(results, baseline, concurrency, tolerance, min_delta):
+    """Routes slower than baseline by more than tolerance and by more than min_delta ms.
+
+    Throughput is compared through the mean latency it implies
+    (concurrency / rps, Little's law), so sub-millisecond jitter on fast
+    routes does not count as a regression.
+    """
+    found = []
+    for url, result in results.items():
+        before = baseline.get(url)
+        if before is None:
+            continue
+        if result['p95'] > before['p95'] * (1 + tolerance) and result['p95'] - before['p95'] > min_delta:
+            found.append(f"{url}: p95 {before['p95']:.2f} -> {result['p95']:.2f} ms")
+        implied_delta = concurrency * 1000 * (1 / result['rps'] - 1 / before['rps'])
+        if result['rps'] < before['rps'] * (1 - tolerance) and implied_delta > min_delta:
+            found.append(f"{url}: {before['rps']:.0f} -> {result['rps']:.0f} req/s")
+        if result['errors'] > before['errors']:
+            found.append(f"{url}: {result['errors']} errors")
+    return found
+
+def bench_routes(args):
+    if args.concurrency is None:
+        # In-process threads share the GIL, so extra concurrency there mostly
+        # measures thread switching; a server gets enough to keep workers busy
+        args.concurrency = 1 if args.server == 'inprocess' else 8
+    urls = route_urls()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        app.configure_logging(filename=os.path.join(directory, 'app.log'), console=False)
+        if args.server == 'gunicorn':
+            server = gunicorn_server(directory, args.preset, args.workers)
+        else:
+            server = contextmanager(lambda: (yield None))()
+        with server as port:
+            fetch = in_process_fetcher() if port is None else socket_fetcher(port)
+            server_name = args.server if port is None else f"gunicorn ({args.preset} preset)"
+            print(f"{server_name}, concurrency {args.concurrency}, best of {args.rounds} x {args.requests} requests per route")
+            print(f"{'route':<48} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9} {'errors':>6}")
+            for url in urls:
+                run_load(fetch, url, args.warmup, args.concurrency)
+                rounds = [summarize(*run_load(fetch, url, args.requests, args.concurrency))
+                          for _ in range(args.rounds)]
+                result = results[url] = best_round(rounds)
+                print(f"{url:<48} {result['p50']:8.2f} {result['p95']:8.2f} {result['p99']:8.2f}"
+                      f" {result['rps']:9.0f} {result['errors']:6d}")
+        app.stop_logging()
+    mean_rps = statistics.mean(result['rps'] for result in results.values())
+    print(f"Mean {mean_rps:.0f} req/s per route, {mean_rps / os.cpu_count():.0f} per core ({os.cpu_count()} cores)")
+
+    setup = {'server': args.server, 'concurrency': args.concurrency,
+             'preset': args.preset if args.server == 'gunicorn' else None,
+             'workers': args.workers if args.server == 'gunicorn' else None}
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baselines = json.load(f)
+        baselines[baseline_name(setup)] = dict(setup, routes=results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+    if args.check:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)[baseline_name(setup)]
+        except (OSError, KeyError):
+            print(f"No baseline for {baseline_name(setup)} in {args.baseline}; run with --save-baseline first")
+            return 2
+        found = regressions(results, baseline['routes'], args.concurrency, args.tolerance, args.min_delta)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            return 1
+        print('No regressions against the baseline')
+    return 0
+
+def baseline_name(setup):
+    name = setup['server']
+    if setup.get('preset'):
+        name += f"-{setup['preset']}"
+    if setup['workers']:
+        name += f"-w{setup['workers']}"
+    return name + f"-c{setup['concurrency']}"
+
+# Bytes of the request a slow client sends at a time
+SLOW_SEND_BYTES = 16
+
+async def raw_get(port, path, read_size=65536, delay=0.0, send_delay=0.0):
+    """GET path over a fresh connection, reading read_size bytes every delay seconds.
+
+    With send_delay the request is also written slowly, a few bytes at a
+    time, like a client on a poor uplink. Returns (seconds to first byte,
+    seconds to last byte, bytes received).
+    """
+    sock = socket.socket()
+    if delay:
+        # A small receive window makes the server wait for us, like a slow mobile link
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, read_size)
+    sock.setblocking(False)
+    start = time.perf_counter()
+    await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+    reader, writer = await asyncio.open_connection(sock=sock, limit=read_size)
+    request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\nUser-Agent: benchmark\r\nConnection: close\r\n\r\n"
+    if send_delay:
+        for offset in range(0, len(request), SLOW_SEND_BYTES):
+            writer.write(request[offset:offset + SLOW_SEND_BYTES].encode('ascii'))
+            await writer.drain()
+            await asyncio.sleep(send_delay)
+    else:
+        writer.write(request.encode('ascii'))
+    first_byte = None
+    received = 0
+    try:
+        while True:
+            data = await reader.read(read_size)
+            if not data:
+                break
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            received += len(data)
+            if delay:
+                await asyncio.sleep(delay)
+    finally:
+        writer.close()
+    return first_byte, time.perf_counter() - start, received
+
+async def slow_client_load(port, args):
+    """Run args.clients slow downloads while probing a fast route; returns the measurements"""
+    probes = []
+    timeouts = 0
+    slow = [asyncio.ensure_future(raw_get(port, args.path, args.read_size, args.read_delay / 1000,
+                                          args.send_delay / 1000))
+            for _ in range(args.clients)]
+    done = asyncio.gather(*slow, return_exceptions=True)
+    while not done.done():
+        try:
+            first_byte, _, _ = await asyncio.wait_for(raw_get(port, '/api/files'), args.probe_timeout)
+            probes.append(first_byte)
+        except asyncio.TimeoutError:
+            timeouts += 1
+        await asyncio.sleep(0.05)
+    downloads = [result for result in await done if not isinstance(result, BaseException)]
+    return {
+        'completed': sum(1 for first_byte, _, received in downloads if first_byte is not None and received),
+        'ttfb': [first_byte for first_byte, _, _ in downloads if first_byte is not None],
+        'duration': max((total for _, total, _ in downloads), default=0.0),
+        'probes': probes,
+        'probe_timeouts': timeouts
+    }
+
+def bench_slow_clients(args):
+    print(f"{args.clients} clients sending {SLOW_SEND_BYTES} bytes per {args.send_delay:g} ms and reading"
+          f" {args.path} at {args.read_size} bytes per {args.read_delay:g} ms;"
+          f" one worker with {args.threads} threads per server")
+    print(f"{'server':<24} {'done':>5} {'ttfb p50':>9} {'ttfb p95':>9} {'all done':>9}"
+          f" {'probe p50':>10} {'probe p95':>10} {'timeouts':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, preset in (('wsgi (gthread)', 'gthread'), ('asgi (uvicorn)', 'asgi')):
+            with gunicorn_server(directory, preset, 1, GUNICORN_THREADS=str(args.threads),
+                                 ASGI_THREADS=str(args.threads)) as port:
+                result = asyncio.run(slow_client_load(port, args))
+            ttfb = result['ttfb'] or [0.0]
+            probes = result['probes'] or [0.0]
+            print(f"{name:<24} {result['completed']:5d} {percentile(ttfb, 0.5):8.2f}s {percentile(ttfb, 0.95):8.2f}s"
+                  f" {result['duration']:8.2f}s {percentile(probes, 0.5) * 1000:8.1f}ms"
+                  f" {percentile(probes, 0.95) * 1000:8.1f}ms {result['probe_timeouts']:9d}")
+
+def measure(produce):
+    """Run produce() (an iterator of chunks); return (first chunk seconds, total seconds, peak bytes)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    for _ in produce():
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, peak
+
+def bench_stream(args):
+    with open(MARKDOWN_FILE, 'rb') as f:
+        raw = f.read()
+
+    def buffered(path):
+        # What /api/markdown does on a cache miss
+        with open(path, 'rb') as f:
+            document = app.compile_markdown(f.read())
+        yield json.dumps({'content': document.processed_content, 'headings': document.toc}).encode('utf-8')
+
+    def streamed(path):
+        with open(path, 'rb') as f:
+            for line in app.stream_markdown_records(f):
+                yield line.encode('utf-8')
+
+    print(f"{'size':>8} {'mode':<9} {'first byte':>11} {'total':>9} {'peak memory':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'document.md')
+        for size in args.sizes:
+            with open(path, 'wb') as f:
+                for _ in range(max(1, int(size * 1024 * 1024 / len(raw)))):
+                    f.write(raw)
+            actual = os.path.getsize(path) / (1024 * 1024)
+            for name, produce in (('buffered', buffered), ('streamed', streamed)):
+                first, total, peak = measure(lambda: produce(path))
+                print(f"{actual:6.1f}MB {name:<9} {first * 1000:9.1f}ms {total * 1000:7.0f}ms"
+                      f" {peak / (1024 * 1024):10.1f}MB")
+
+def bench_render(args):
+    app.create_app({'LOG_MODE': 'off'})
+    client = app.app.test_client()
+
+    # Cold: what a new process pays to compile index.html, without and
+    # with Jinja's bytecode cache
+    def compile_template(bytecode_cache=None):
+        environment = app.app.create_jinja_environment()
+        environment.bytecode_cache = bytecode_cache
+        environment.get_template('index.html')
+
+    with tempfile.TemporaryDirectory() as directory:
+        bytecode_cache = app.FileSystemBytecodeCache(directory)
+        compile_template(bytecode_cache)
+        compiled = timeit.timeit(compile_template, number=args.repeat)
+        report('compile index.html', compiled, args.repeat)
+        report('load from bytecode cache', timeit.timeit(lambda: compile_template(bytecode_cache),
+                                                          number=args.repeat), args.repeat, compiled)
+
+    # Warm: GET / rendering the page every time, against the page cache
+    for encoding in ('identity', 'gzip'):
+        headers = {'Accept-Encoding': encoding}
+
+        def uncached():
+            app.page_cache.clear()
+            client.get('/', headers=headers)
+
+        rendered = timeit.timeit(uncached, number=args.repeat)
+        report(f"GET / rendered ({encoding})", rendered, args.repeat)
+        report(f"GET / cached ({encoding})", timeit.timeit(lambda: client.get('/', headers=headers),
+                                                           number=args.repeat), args.repeat, rendered)
+
+# Run in a fresh interpreter by bench_startup; prints the phase timings
+COLD_START_SCRIPT = """
+import json, sys, time
+started = time.time()
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app({'LOG_FILE': sys.argv[1]})
+t2 = time.perf_counter()
+status = app.app.test_client().get('/').status_code
+t3 = time.perf_counter()
+print(json.dumps({'started': started, 'import': t1 - t0, 'create_app': t2 - t1,
+                  'first_response': t3 - t2, 'status': status}))
+"""
+
+def cold_start_inprocess(directory):
+    """Phase timings of one cold start in a fresh interpreter, in ms"""
+    base_dir = os.path.dirname(os.path.abspath(app.__file__))
+    env = dict(os.environ, PYTHONPATH=base_dir)
+    launched = time.time()
+    output = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT, os.path.join(directory, 'app.log')],
+                            cwd=directory, env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    if result['status'] != 200:
+        raise RuntimeError(f"First response was {result['status']}")
+    timings = {'interpreter': (result['started'] - launched) * 1000}
+    for phase in ('import', 'create_app', 'first_response'):
+        timings[phase] = result[phase] * 1000
+    timings['total'] = sum(timings.values())
+    return timings
+
+def cold_start_gunicorn(directory, preset):
+    """Milliseconds from launching gunicorn to its first successful response"""
+    launched = time.perf_counter()
+    with gunicorn_server(directory, preset, 1, poll_interval=0.005):
+        return {'total': (time.perf_counter() - launched) * 1000}
+
+def bench_startup(args):
+    runs = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(args.runs):
+            if args.server == 'gunicorn':
+                runs.append(cold_start_gunicorn(directory, args.preset))
+            else:
+                runs.append(cold_start_inprocess(directory))
+    result = {phase: statistics.median(run[phase] for run in runs) for phase in runs[0]}
+    name = 'startup-inprocess' if args.server == 'inprocess' else f"startup-gunicorn-{args.preset}"
+    print(f"Cold start to first response, {name}, median of {args.runs} runs:")
+    for phase, value in result.items():
+        print(f"  {phase:<16} {value:8.1f} ms")
+
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baselines = json.load(f)
+        baselines[name] = result
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+    if args.check:
+        try:
+            with open(args.baseline) as f:
+                before = json.load(f)[name]
+        except (OSError, KeyError):
+            print(f"No baseline for {name} in {args.baseline}; run with --save-baseline first")
+            return 2
+        if result['total'] > before['total'] * (1 + args.tolerance) and \
+                result['total'] - before['total'] > args.min_delta:
+            print(f"REGRESSION cold start {before['total']:.1f} -> {result['total']:.1f} ms")
+            return 1
+        print('No regressions against the baseline')
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    markdown = subparsers.add_parser('markdown', help='markdown compiler vs. the legacy two-pass code')
+    markdown.add_argument('--repeat', type=int, default=200)
+    markdown.set_defaults(func=bench_markdown)
+
+    logging_parser = subparsers.add_parser('logging', help='page-load request latency with file logging off, sync and async')
+    logging_parser.add_argument('--requests', type=int, default=2000)
+    logging_parser.add_argument('--write-delay', type=float, default=0,
+                                help='simulated latency of each log file write, in ms')
+    logging_parser.set_defaults(func=bench_logging)
+
+    routes = subparsers.add_parser('routes', help='latency and throughput of every route, with baseline checks')
+    routes.add_argument('--server', choices=('inprocess', 'gunicorn'), default='inprocess')
+    routes.add_argument('--preset', choices=('sync', 'gthread', 'threaded'), default='sync',
+                        help='gunicorn.conf.py worker preset')
+    routes.add_argument('--workers', type=int, help='override the number of gunicorn workers')
+    routes.add_argument('--concurrency', type=int, help='client threads (default 1 in-process, 8 for gunicorn)')
+    routes.add_argument('--requests', type=int, default=300, help='requests per route and round')
+    routes.add_argument('--rounds', type=int, default=3, help='timed rounds per route; the best is reported')
+    routes.add_argument('--warmup', type=int, default=20, help='untimed requests per route first')
+    routes.add_argument('--baseline', default=DEFAULT_BASELINE)
+    routes.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    routes.add_argument('--check', action='store_true', help='exit 1 if any route regressed against the baseline')
+    routes.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, as a fraction')
+    routes.add_argument('--min-delta', type=float, default=1.0,
+                        help='ignore latency increases smaller than this many ms')
+    routes.set_defaults(func=bench_routes)
+
+    slow = subparsers.add_parser('slow-clients', help='WSGI vs. ASGI under many slow concurrent downloads')
+    slow.add_argument('--clients', type=int, default=200)
+    slow.add_argument('--path', default='/api/markdown')
+    slow.add_argument('--read-size', type=int, default=4096, help='bytes a client reads at a time')
+    slow.add_argument('--read-delay', type=float, default=20, help='ms a client waits between reads')
+    slow.add_argument('--send-delay', type=float, default=50,
+                      help=f'ms a client waits between {SLOW_SEND_BYTES}-byte pieces of its request')
+    slow.add_argument('--threads', type=int, default=8, help='threads per server')
+    slow.add_argument('--probe-timeout', type=float, default=10, help='seconds before a probe counts as timed out')
+    slow.set_defaults(func=bench_slow_clients)
+
+    stream = subparsers.add_parser('stream', help='buffered /api/markdown vs. NDJSON streaming on large documents')
+    stream.add_argument('--sizes', type=lambda value: [float(size) for size in value.split(',')], default=[1, 10, 40],
+                        help='document sizes in MB, comma-separated')
+    stream.set_defaults(func=bench_stream)
+
+    render = subparsers.add_parser('render', help='index page compile and render times, with and without caches')
+    render.add_argument('--repeat', type=int, default=200)
+    render.set_defaults(func=bench_render)
+
+    startup = subparsers.add_parser('startup', help='cold start to first response, with baseline checks')
+    startup.add_argument('--server', choices=('inprocess', 'gunicorn'), default='inprocess')
+    startup.add_argument('--preset', choices=('sync', 'gthread', 'threaded', 'asgi'), default='sync',
+                         help='gunicorn.conf.py worker preset')
+    startup.add_argument('--runs', type=int, default=5, help='cold starts; the median is reported')
+    startup.add_argument('--baseline', default=DEFAULT_BASELINE)
+    startup.add_argument('--save-baseline', action='store_true', help='store this result as the baseline')
+    startup.add_argument('--check', action='store_true', help='exit 1 if the cold start regressed against the baseline')
+    startup.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, as a fraction')
+    startup.add_argument('--min-delta', type=float, default=50.0,
+                         help='ignore slowdowns smaller than this many ms')
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,422 @@
+"""
+Cache Backends
+
+Byte-string caches behind one small interface, so app.py can keep encoded
+responses in this process, in shared memory for every worker on the host,
+or in Redis for every host:
+
+    memory  MemoryCache: a bounded LRU with a TTL, in this process
+    shm     SharedMemoryCache: one file per entry in a tmpfs directory
+            (/dev/shm), read by every process on the host
+    redis   RedisCache: a Redis server (needs the redis package)
+
+Every backend has get(key), set(key, value), invalidate() and stats(); keys
+are strings and values bytes. A backend never raises from get or set: a
+store that cannot be reached counts an error and behaves as a miss.
+
+invalidate() drops every entry for every process that uses the same store.
+The shared backends keep a generation number next to the entries, bump it,
+and treat entries from older generations as missing. RedisCache also
+publishes the new generation, so other processes learn of it without
+asking the server on each read. invalidate(token) names the change being
+handled; the shared backends record the token and skip the bump if it is
+the one recorded last, so when every worker reacts to the same change the
+store is only cleared once.
+
+Nothing is opened or created until a backend is first used, so backends
+can be made before a server forks.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+BACKENDS = ('memory', 'shm', 'redis')
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 3600.0
+
+# SharedMemoryCache files: the generation file holds one counter; an entry
+# file starts with the generation it was written in and its expiry time
+# (time.time(), 0 for none), followed by the value
+GENERATION_FILE = 'generation'
+# Token of the last invalidation, next to the generation file
+TOKEN_FILE = 'invalidated'
+GENERATION = struct.Struct('Q')
+ENTRY_HEADER = struct.Struct('Qd')
+TEMPORARY_SUFFIX = '.tmp'
+
+REDIS_ERRORS = (redis.RedisError, OSError) if redis is not None else (OSError,)
+# Seconds a RedisCache waits to connect or for a reply, and after a failure
+# before it tries the server again; in between every call is a miss
+REDIS_TIMEOUT = 0.5
+REDIS_RETRY_DELAY = 5.0
+
+def default_directory():
+    """Per-user directory for SharedMemoryCache, on tmpfs where there is one"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    user = os.getuid() if hasattr(os, 'getuid') else 'user'
+    return os.path.join(base, f"ai-first-cache-{user}")
+
+class MemoryCache:
+    """Least recently used entries of this process.
+
+    Bounded by max_entries and max_bytes (of values); each entry is kept
+    for at most ttl seconds (None: until evicted). Other processes have
+    their own copy, so invalidate() only clears this one.
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (expiry on the monotonic clock or None, value)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires, value)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._bytes -= len(self._entries.pop(key)[1])
+
+    def invalidate(self, token=None):
+        # Nothing is shared, so every process clears its own copy
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.name, 'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+class SharedMemoryCache:
+    """Entries shared by every process on the host, one file each in directory.
+
+    Put the directory on tmpfs (/dev/shm on Linux), so entries live in
+    memory and a read is an open and a read, with no disk involved. An
+    entry is written under a temporary name and renamed into place, so a
+    reader sees a whole entry or none. The generation counter is a small
+    file every process maps into memory, so checking it costs no system
+    call. Once about max_bytes/8 has been written by this process, the
+    oldest entries are removed until the directory holds at most max_bytes.
+    """
+
+    name = 'shm'
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, ttl=None):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._map = None
+        self._written = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _generation_map(self):
+        # A shared mapping stays shared in forked children, so one per process tree is enough
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    os.makedirs(self.directory, mode=0o700, exist_ok=True)
+                    fd = os.open(os.path.join(self.directory, GENERATION_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+                    try:
+                        if os.fstat(fd).st_size < GENERATION.size:
+                            os.ftruncate(fd, GENERATION.size)
+                        self._map = mmap.mmap(fd, GENERATION.size)
+                    finally:
+                        os.close(fd)
+        return self._map
+
+    @property
+    def generation(self):
+        return GENERATION.unpack_from(self._generation_map())[0]
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            generation = self.generation
+            with open(self._path(key), 'rb') as f:
+                header = f.read(ENTRY_HEADER.size)
+                if len(header) == ENTRY_HEADER.size:
+                    written_in, expires = ENTRY_HEADER.unpack(header)
+                    if written_in == generation and (not expires or expires > time.time()):
+                        value = f.read()
+                        self.hits += 1
+                        return value
+        except FileNotFoundError:
+            pass
+        except OSError:
+            self.errors += 1
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}{TEMPORARY_SUFFIX}"
+        try:
+            header = ENTRY_HEADER.pack(self.generation, time.time() + self.ttl if self.ttl else 0.0)
+            with open(temporary, 'wb') as f:
+                f.write(header)
+                f.write(value)
+            os.replace(temporary, path)
+        except OSError:
+            # e.g. tmpfs full: the entry is simply not cached
+            self.errors += 1
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            return
+        self._written += len(value)
+        if self._written > self.max_bytes // 8:
+            self._written = 0
+            self._sweep()
+
+    def _entry_files(self):
+        for entry in os.scandir(self.directory):
+            if entry.name not in (GENERATION_FILE, TOKEN_FILE) and entry.is_file(follow_symlinks=False):
+                yield entry
+
+    def _sweep(self):
+        """Remove expired entries, then the oldest until the total fits in max_bytes"""
+        files = []
+        now = time.time()
+        try:
+            for entry in self._entry_files():
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            self.errors += 1
+            return
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if total <= self.max_bytes and not (self.ttl and mtime + self.ttl < now):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def invalidate(self, token=None):
+        """Start a new generation, then remove the files of the old ones.
+
+        Does nothing if token is the token of the last invalidation.
+        """
+        try:
+            generation_map = self._generation_map()
+            with open(os.path.join(self.directory, GENERATION_FILE), 'rb') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                if token is not None:
+                    token_path = os.path.join(self.directory, TOKEN_FILE)
+                    try:
+                        with open(token_path, encoding='utf-8') as f:
+                            if f.read() == token:
+                                return
+                    except FileNotFoundError:
+                        pass
+                    with open(token_path, 'w', encoding='utf-8') as f:
+                        f.write(token)
+                GENERATION.pack_into(generation_map, 0, GENERATION.unpack_from(generation_map)[0] + 1)
+            for entry in self._entry_files():
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        except OSError:
+            self.errors += 1
+
+    def stats(self):
+        return {'backend': self.name, 'hits': self.hits, 'misses': self.misses, 'errors': self.errors,
+                'directory': self.directory}
+
+class RedisCache:
+    """Entries in Redis, shared by every process and host using the same server and prefix.
+
+    An entry is stored as prefix:generation:key with the TTL as its Redis
+    expiry, so entries of old generations expire on their own (without a
+    TTL they stay until Redis evicts them under its maxmemory policy).
+    invalidate() increments prefix:generation and publishes the new value
+    on prefix:invalidate. A listener thread in every process picks it up,
+    so a read is one GET. client may be any object with the redis-py API (e.g. a
+    fakeredis instance as a local stand-in); by default one is made from url.
+
+    A server that does not answer within REDIS_TIMEOUT counts an error, and
+    for the next REDIS_RETRY_DELAY seconds the cache is not asked at all,
+    so a stalled server costs one timeout every few seconds rather than one
+    per request.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url='redis://localhost:6379/0', ttl=DEFAULT_TTL, prefix='ai-first-portal', client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError('The redis cache backend needs the redis package (pip install redis)')
+            # Fail fast instead of hanging a request when the server is unreachable or stalled
+            client = redis.Redis.from_url(url, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT)
+        self.client = client
+        # None or 0: entries do not expire, as with the other backends
+        self.ttl = ttl or None
+        self.prefix = prefix
+        self._generation_key = f"{prefix}:generation"
+        self._token_key = f"{prefix}:invalidated"
+        self._channel = f"{prefix}:invalidate"
+        self._lock = threading.Lock()
+        self._generation = None
+        self._listener_pid = None
+        # time.monotonic() before which the server is not tried again
+        self._retry_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _available(self):
+        return time.monotonic() >= self._retry_at
+
+    def _failed(self):
+        self.errors += 1
+        self._retry_at = time.monotonic() + REDIS_RETRY_DELAY
+
+    def _ensure_listener(self):
+        # One listener per process; a forked child starts its own
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            # Subscribe before reading the generation, so no bump in between is missed
+            pubsub.subscribe(self._channel)
+            self._generation = None
+            self._listener_pid = os.getpid()
+            threading.Thread(target=self._listen, args=(pubsub,), name='cache-invalidations', daemon=True).start()
+
+    def _listen(self, pubsub):
+        try:
+            while True:
+                # Polled, since a blocking read would end at the socket timeout
+                message = pubsub.get_message(timeout=REDIS_RETRY_DELAY)
+                if message is not None and message['type'] == 'message':
+                    self._generation = max(self._generation or 0, int(message['data']))
+        except Exception:
+            pass
+        # Subscription lost: the next call subscribes again and rereads the generation
+        self._listener_pid = None
+        self._generation = None
+
+    def _key(self, key):
+        self._ensure_listener()
+        generation = self._generation
+        if generation is None:
+            generation = self._generation = int(self.client.get(self._generation_key) or 0)
+        return f"{self.prefix}:{generation}:{key}"
+
+    def get(self, key):
+        value = None
+        if self._available():
+            try:
+                value = self.client.get(self._key(key))
+            except REDIS_ERRORS:
+                self._failed()
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if not self._available():
+            return
+        try:
+            self.client.set(self._key(key), value, ex=max(1, int(self.ttl)) if self.ttl else None)
+        except REDIS_ERRORS:
+            self._failed()
+
+    def invalidate(self, token=None):
+        """Bump and publish the generation, unless token is the token of the last invalidation"""
+        try:
+            if token is not None:
+                # Atomic, so of the workers handling one change only the first gets a different token back
+                previous = self.client.getset(self._token_key, token)
+                if isinstance(previous, bytes):
+                    previous = previous.decode('utf-8')
+                if previous == token:
+                    return
+            generation = self.client.incr(self._generation_key)
+            self._generation = max(self._generation or 0, generation)
+            self.client.publish(self._channel, generation)
+        except REDIS_ERRORS:
+            self._failed()
+
+    def stats(self):
+        return {'backend': self.name, 'hits': self.hits, 'misses': self.misses, 'errors': self.errors,
+                'generation': self._generation}
+
+def create(backend, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=None, directory=None,
+           url=None):
+    """A backend by name (see BACKENDS); ttl is in seconds, None or 0 for none"""
+    ttl = ttl or None
+    if backend == 'memory':
+        return MemoryCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+    if backend == 'shm':
+        return SharedMemoryCache(directory, max_bytes=max_bytes, ttl=ttl)
+    if backend == 'redis':
+        return RedisCache(url or 'redis://localhost:6379/0', ttl=ttl)
+    raise ValueError(f"Unknown cache backend {backend!r}; expected one of {', '.join(BACKENDS)}")
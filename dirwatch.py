@@ -0,0 +1,262 @@
+"""
+Directory Watcher
+
+Reports changed paths under a directory tree to a callback. Uses Linux
+inotify (through ctypes, no extra dependencies) and falls back to polling
+on other platforms or when inotify is unavailable.
+
+The callback is called from the watcher thread with a set of absolute
+paths that were created, modified, moved or deleted, or with None when
+events were lost and the caller should rescan everything.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+def _load_inotify():
+    """Return libc if it provides inotify, else None"""
+    if not hasattr(os, 'O_NONBLOCK'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+def snapshot(root, ignore=None):
+    """Map every file under root to its (inode, mtime_ns, size)"""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        if ignore is not None:
+            dirnames[:] = [d for d in dirnames if not ignore(os.path.join(dirpath, d))]
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if ignore is not None and ignore(path):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files[path] = (st.st_ino, st.st_mtime_ns, st.st_size)
+    return files
+
+class DirectoryWatcher:
+    """Watch root recursively and pass batches of changed paths to callback.
+
+    mode is 'auto' (inotify if possible, otherwise polling), 'inotify' or
+    'poll'. Bursts of events are coalesced: a batch is delivered once no
+    new event has arrived for `debounce` seconds, or after `max_delay`
+    seconds under a continuous stream of events. ignore, if given, is
+    called with absolute paths and returns True for paths (and directories)
+    to leave out.
+    """
+
+    def __init__(self, root, callback, mode='auto', poll_interval=2.0, debounce=0.05, max_delay=1.0,
+                 ignore=None):
+        self.root = os.path.abspath(root)
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.ignore = ignore
+        self.requested_mode = mode
+        self.mode = None
+        self.batches = 0
+        self.events = 0
+        # time.monotonic() when the changes in the batch being delivered were first seen
+        self.batch_started = None
+        self._libc = None
+        self._fd = None
+        self._watches = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start watching in a daemon thread. Returns the mode in use."""
+        if self._thread is not None:
+            return self.mode
+        self._stop.clear()
+        self.mode = 'poll'
+        if self.requested_mode in ('auto', 'inotify'):
+            try:
+                self._start_inotify()
+                self.mode = 'inotify'
+            except OSError:
+                if self.requested_mode == 'inotify':
+                    raise
+                self._close_inotify()
+        target = self._run_inotify if self.mode == 'inotify' else self._run_polling
+        self._thread = threading.Thread(target=target, name=f"dirwatch:{self.root}", daemon=True)
+        self._thread.start()
+        return self.mode
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=max(self.poll_interval, 1.0) + 1.0)
+        self._thread = None
+        self._close_inotify()
+
+    def forget(self):
+        """Drop state inherited across fork (the thread is gone, the inotify fd is the parent's)"""
+        self._thread = None
+        self._stop = threading.Event()
+        self._close_inotify()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _deliver(self, paths, started=None):
+        self.batches += 1
+        self.batch_started = time.monotonic() if started is None else started
+        self.callback(paths)
+
+    # inotify backend
+
+    def _start_inotify(self):
+        self._libc = _load_inotify()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        self._watch_tree(self.root)
+
+    def _close_inotify(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+        self._fd = None
+        self._watches = {}
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK | IN_ONLYDIR)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(err, f"inotify_add_watch({path}): {os.strerror(err)}")
+        self._watches[wd] = path
+
+    def _watch_tree(self, top):
+        """Watch top and every directory below it; returns the files found"""
+        found = set()
+        for dirpath, dirnames, filenames in os.walk(top):
+            if self.ignore is not None:
+                dirnames[:] = [d for d in dirnames if not self.ignore(os.path.join(dirpath, d))]
+            self._add_watch(dirpath)
+            found.update(os.path.join(dirpath, filename) for filename in filenames)
+        return found
+
+    def _read_events(self, pending):
+        """Read queued events into pending; returns False if events were lost"""
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return True
+        offset = 0
+        complete = True
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            self.events += 1
+
+            if mask & IN_Q_OVERFLOW:
+                complete = False
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if self.ignore is not None and self.ignore(path):
+                continue
+            pending.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # A new subtree: watch it and report whatever is already inside
+                try:
+                    pending.update(self._watch_tree(path))
+                except OSError:
+                    complete = False
+        return complete
+
+    def _run_inotify(self):
+        pending = set()
+        complete = True
+        first_event = None
+        while not self._stop.is_set():
+            timeout = self.debounce if pending or not complete else 0.5
+            ready, _, _ = select.select([self._fd], [], [], timeout)
+            if ready:
+                if first_event is None:
+                    first_event = time.monotonic()
+                complete = self._read_events(pending) and complete
+                if time.monotonic() - first_event < self.max_delay:
+                    continue
+            started, first_event = first_event, None
+            if not complete:
+                # Events were dropped: re-watch everything and ask for a full rescan
+                try:
+                    self._watch_tree(self.root)
+                except OSError:
+                    pass
+                pending.clear()
+                complete = True
+                self._deliver(None, started)
+            elif pending:
+                batch, pending = pending, set()
+                self._deliver(batch, started)
+
+    # Polling backend
+
+    def _run_polling(self):
+        previous = snapshot(self.root, self.ignore)
+        while not self._stop.wait(self.poll_interval):
+            started = time.monotonic()
+            current = snapshot(self.root, self.ignore)
+            changed = set(previous.keys() ^ current.keys())
+            changed.update(path for path, version in current.items()
+                           if path in previous and previous[path] != version)
+            previous = current
+            if changed:
+                self.events += len(changed)
+                self._deliver(changed, started)
@@ -4,66 +4,578 @@ Flat Directory Copier
 
 This script copies all files from the current directory and its subdirectories
 into a single 'flat' directory, overwriting any existing files with the same name.
+
+Runs are incremental. A manifest in the flat directory records the source,
+size, mtime and SHA-1 of every file copied, so a rerun only copies files
+that are new or changed, and removes outputs whose source has gone. An
+unchanged tree costs one stat per file. Copies run on a thread pool.
+Outputs edited or deleted by hand are only restored by --full.
+
+With --dedup every file is kept: files that share a name get their
+directory added to it, and each distinct content is written once, the
+other outputs with that content becoming hard links (or reflinks) to it.
+
+Files and directories matching an ignore pattern are skipped (directories
+are not even walked). The defaults are .git, flat and *.log; add more with
+--ignore or one glob per line in a .flattenignore file in the source
+directory. A pattern matches a file or directory name, or its path
+relative to the source directory.
+
+With --watch the script syncs once and then keeps running, applying each
+burst of changes as it happens (see watch_directory).
+
+Usage:
+    python flatten.py [--ignore PATTERN ...] [--jobs N] [--full] [--verbose]
+    python flatten.py --dedup [--link auto|hardlink|reflink|copy]
+    python flatten.py --watch [--watch-mode auto|inotify|poll] [--debounce MS]
 """
 
+import argparse
+import errno
+import fnmatch
+import hashlib
+import json
 import os
+import re
+import queue
 import shutil
+import stat
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dirwatch import DirectoryWatcher
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_IGNORE = ['.git', 'flat', '*.log']
+IGNORE_FILE = '.flattenignore'
+MANIFEST_NAME = '.flatten-manifest.json'
+MANIFEST_VERSION = 1
+DEFAULT_JOBS = 8
+HASH_CHUNK_SIZE = 1024 * 1024
+# --watch: seconds to wait for a burst of events to end, seconds between
+# scans when polling, and seconds between stats lines
+DEFAULT_DEBOUNCE = 0.1
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_STATS_INTERVAL = 10.0
+
+# How --dedup writes outputs. The first output with a given content comes
+# from its source: 'auto' and 'reflink' try a reflink (btrfs, XFS), else
+# copy. Later outputs with the same content: 'auto' and 'hardlink' make a
+# hard link to the first, 'reflink' a reflink, 'copy' a plain copy.
+LINK_MODES = ('auto', 'hardlink', 'reflink', 'copy')
+# Linux ioctl that shares a file's extents with another (a reflink)
+FICLONE = 0x40049409
+
+def load_ignore_patterns(source_dir, extra=()):
+    """Default patterns, those in source_dir/.flattenignore, then extra"""
+    patterns = list(DEFAULT_IGNORE)
+    try:
+        with open(os.path.join(source_dir, IGNORE_FILE)) as f:
+            patterns.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    except FileNotFoundError:
+        pass
+    patterns.extend(extra)
+    # "flat/" in an ignore file means the directory flat
+    return [pattern.rstrip('/') for pattern in patterns]
+
+def compile_patterns(patterns):
+    """One regex for all patterns, instead of an fnmatch call per pattern and file"""
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns) or r'(?!)')
+
+def is_ignored(name, relative_path, matcher):
+    return matcher.match(name) is not None or matcher.match(relative_path) is not None
+
+def scan_sources(source_dir, flat_dir, patterns, skip_paths=(), top=None):
+    """List (relative path, stat result) for every file to flatten, in walk order.
+
+    Directories are walked in sorted order, so the order (and with it which
+    file wins a name collision) is the same every run. top limits the scan to
+    one directory below source_dir; paths stay relative to source_dir.
+    """
+    sources = []
+    matcher = compile_patterns(patterns)
+    flat_real = os.path.realpath(flat_dir)
+    for root, dirs, files in os.walk(top or source_dir):
+        relative_root = os.path.relpath(root, source_dir)
+        relative_root = '' if relative_root == '.' else relative_root.replace(os.sep, '/') + '/'
+        # Prune ignored directories (and the flat directory itself) before descending
+        dirs[:] = sorted(
+            d for d in dirs
+            if not is_ignored(d, relative_root + d, matcher)
+            and os.path.realpath(os.path.join(root, d)) != flat_real
+        )
+        for file in sorted(files):
+            relative_path = relative_root + file
+            if is_ignored(file, relative_path, matcher):
+                continue
+            path = os.path.join(root, file)
+            if path in skip_paths:
+                continue
+            try:
+                sources.append((relative_path, os.stat(path)))
+            except OSError as e:
+                print(f"Error reading {path}: {e}", file=sys.stderr)
+    return sources
+
+def walk_order(relative_path):
+    """Sort key that puts relative paths in scan_sources order: a directory's
+    files (by name) before its subdirectories (by name)"""
+    parts = relative_path.split('/')
+    return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+def output_names(sources, disambiguate=False):
+    """Map output names to sources; returns (names, number of name collisions).
 
-def flatten_directory():
+    By default the last file with a name wins, as the flat copy always did.
+    With disambiguate every file keeps an output: the one nearest the top
+    (then first alphabetically) keeps the plain name and the others get
+    their directory added, e.g. templates/app.js -> app--templates.js.
+    """
+    groups = {}
+    for relative_path, st in sources:
+        groups.setdefault(relative_path.rsplit('/', 1)[-1], []).append((relative_path, st))
+    names = {}
+    collisions = 0
+    for name, group in groups.items():
+        collisions += len(group) - 1
+        if not disambiguate:
+            names[name] = group[-1]
+            continue
+        group.sort(key=lambda source: (source[0].count('/'), source[0]))
+        names[name] = group[0]
+        stem, extension = os.path.splitext(name)
+        for relative_path, st in group[1:]:
+            parent = relative_path.rsplit('/', 1)[0].replace('/', '-')
+            candidate = f"{stem}--{parent}{extension}"
+            number = 1
+            while candidate in names or candidate in groups:
+                number += 1
+                candidate = f"{stem}--{parent}-{number}{extension}"
+            names[candidate] = (relative_path, st)
+    return names, collisions
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('files', {})
+
+def save_manifest(path, files):
+    # Write to a temporary file first, so an interrupted run leaves the old manifest intact
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        # No indent: that would bypass json's C encoder
+        f.write(json.dumps({'version': MANIFEST_VERSION, 'files': files}, sort_keys=True))
+    os.replace(temporary, path)
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def clone_file(source_path, target_path):
+    """Reflink target_path to source_path (copy-on-write, no data copied)"""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'reflinks need fcntl')
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    shutil.copystat(source_path, target_path)
+
+class Placer:
+    """Writes outputs into the flat directory.
+
+    Every output is written to a temporary name and renamed into place, so
+    an existing output, which may be hard-linked to others, is replaced
+    rather than overwritten. link is one of LINK_MODES; reflinks are only
+    tried until the filesystem first refuses one.
+    """
+
+    def __init__(self, flat_dir, link='copy'):
+        self.flat_dir = flat_dir
+        self.link = link
+        self.reflinks = link in ('auto', 'reflink')
+
+    def _replace(self, name, write):
+        target = os.path.join(self.flat_dir, name)
+        temporary = f"{target}.flatten-tmp"
+        try:
+            write(temporary)
+            os.replace(temporary, target)
+        except BaseException:
+            if os.path.lexists(temporary):
+                os.remove(temporary)
+            raise
+
+    def _clone_or_copy(self, source_path, name):
+        """Copy source_path to name, as a reflink where possible; returns how"""
+        if self.reflinks:
+            try:
+                self._replace(name, lambda temporary: clone_file(source_path, temporary))
+                return 'reflinked'
+            except OSError:
+                self.reflinks = False
+        self._replace(name, lambda temporary: shutil.copy2(source_path, temporary))
+        return 'copied'
+
+    def place(self, source_path, name):
+        """Write a file's content from its source"""
+        return self._clone_or_copy(source_path, name)
+
+    def duplicate(self, anchor, name, source_path):
+        """Give name the content of the output anchor, which has the same hash.
+
+        Falls back to the file's own source if the anchor cannot be used.
+        """
+        anchor_path = os.path.join(self.flat_dir, anchor)
+        if self.link in ('auto', 'hardlink'):
+            try:
+                self._replace(name, lambda temporary: os.link(anchor_path, temporary))
+                return 'hardlinked'
+            except OSError:
+                # e.g. no hard links on this filesystem, or too many links
+                pass
+        try:
+            return self._clone_or_copy(anchor_path, name)
+        except OSError:
+            return self.place(source_path, name)
+
+def hash_source(source_path):
+    """(stat result, SHA-1) of a source file"""
+    return os.stat(source_path), file_sha1(source_path)
+
+def prepare_directories(source_dir=None, flat_dir=None):
+    """(script path, source directory, flat directory), creating the flat directory"""
     # Get the current directory (where the script is running)
-    current_dir = os.path.dirname(os.path.abspath(__file__)) if os.path.dirname(os.path.abspath(__file__)) else "."
-    
+    script_path = os.path.abspath(__file__)
+    current_dir = source_dir or os.path.dirname(script_path) or "."
+
     # Define the target flat directory
-    flat_dir = os.path.join(current_dir, "flat")
-    
+    flat_dir = flat_dir or os.path.join(current_dir, "flat")
+
     # Create the flat directory if it doesn't exist
     if not os.path.exists(flat_dir):
         os.makedirs(flat_dir)
         print(f"Created target directory: {flat_dir}")
-    
-    # Keep track of stats
-    total_files = 0
-    copied_files = 0
-    skipped_files = 0
-    errors = 0
-    
-    # Walk through the directory tree
-    for root, dirs, files in os.walk(current_dir):
-        # Skip the flat directory itself to avoid infinite recursion
-        if os.path.samefile(root, flat_dir):
-            continue
-            
-        for file in files:
-            total_files += 1
-            source_path = os.path.join(root, file)
-            target_path = os.path.join(flat_dir, file)
-            
-            # Skip this script itself
-            if os.path.samefile(source_path, os.path.abspath(__file__)):
-                skipped_files += 1
-                continue
-                
+    return script_path, current_dir, flat_dir
+
+def new_stats(total=0, collisions=0):
+    return {'total': total, 'copied': 0, 'linked': 0, 'unchanged': 0, 'removed': 0,
+            'collisions': collisions, 'errors': 0, 'bytes': 0, 'unique_bytes': 0}
+
+def sync_outputs(current_dir, flat_dir, names, previous, placer, stats, jobs=DEFAULT_JOBS, dedup=False,
+                 verbose=False):
+    """Turn the outputs recorded in previous into those in names; returns the new manifest.
+
+    names maps output names to (relative path, stat result), see output_names.
+    Only outputs whose source is new or has changed are written, and outputs
+    no longer in names are removed. Counts are added to stats.
+    """
+    files = {}
+    pending = []
+    for name, (relative_path, st) in names.items():
+        record = previous.get(name)
+        if (record is not None and record['source'] == relative_path and record['size'] == st.st_size
+                and record['mtime_ns'] == st.st_mtime_ns):
+            files[name] = record
+            stats['unchanged'] += 1
+        else:
+            pending.append((name, relative_path))
+
+    def failed(action, path, error):
+        stats['errors'] += 1
+        print(f"Error {action} {path}: {error}", file=sys.stderr)
+
+    def report(name, source_path, how):
+        stats['linked' if how == 'hardlinked' or (dedup and how == 'reflinked') else 'copied'] += 1
+        if verbose:
+            print(f"{how.capitalize()}: {source_path} -> {os.path.join(flat_dir, name)}")
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        # Hash new and changed files (each one once), several at a time
+        hashed = [(name, relative_path, executor.submit(hash_source, os.path.join(current_dir, relative_path)))
+                  for name, relative_path in pending]
+        to_place = []
+        for name, relative_path, future in hashed:
             try:
-                # Copy the file, overwriting if it exists
-                shutil.copy2(source_path, target_path)
-                copied_files += 1
-                print(f"Copied: {source_path} -> {target_path}")
-                
-                # Handle name collisions (files with the same name from different directories)
-                # If there are multiple files with the same name, they'll overwrite each other
-                
-            except (shutil.SameFileError, PermissionError, OSError) as e:
-                errors += 1
-                print(f"Error copying {source_path}: {e}", file=sys.stderr)
-    
+                st, digest = future.result()
+            except OSError as e:
+                failed('reading', os.path.join(current_dir, relative_path), e)
+                continue
+            files[name] = {'source': relative_path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': digest}
+            record = previous.get(name)
+            if record is not None and record['sha1'] == digest and os.path.exists(os.path.join(flat_dir, name)):
+                # Touched but not changed: keep the output as it is
+                stats['unchanged'] += 1
+            else:
+                to_place.append(name)
+
+        # Outputs kept from earlier runs already hold their content
+        anchors = {}
+        if dedup:
+            for name, record in files.items():
+                if name not in to_place:
+                    anchors.setdefault(record['sha1'], name)
+
+        # First wave: content that must come from a source; second wave
+        # (dedup only): outputs whose content another output already has
+        first, second = [], []
+        for name in to_place:
+            digest = files[name]['sha1']
+            if dedup and digest in anchors:
+                second.append((name, anchors[digest]))
+            else:
+                first.append(name)
+                if dedup:
+                    anchors[digest] = name
+        def source_of(name):
+            return os.path.join(current_dir, files[name]['source'])
+
+        def finish(futures):
+            for name, future in futures:
+                try:
+                    report(name, source_of(name), future.result())
+                except (shutil.SameFileError, PermissionError, OSError) as e:
+                    failed('copying', source_of(name), e)
+                    del files[name]
+
+        finish([(name, executor.submit(placer.place, source_of(name), name)) for name in first])
+        # Submitted only once the first wave is done, so every anchor exists
+        finish([(name, executor.submit(placer.duplicate, anchor, name, source_of(name)))
+                for name, anchor in second])
+
+    # Remove outputs this script wrote earlier whose source is gone (or now ignored)
+    for name in previous.keys() - names.keys():
+        try:
+            os.remove(os.path.join(flat_dir, name))
+            stats['removed'] += 1
+            if verbose:
+                print(f"Removed: {os.path.join(flat_dir, name)}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            failed('removing', os.path.join(flat_dir, name), e)
+            files[name] = previous[name]
+    return files
+
+def flatten_directory(source_dir=None, flat_dir=None, ignore=(), jobs=DEFAULT_JOBS, full=False, verbose=False,
+                      dedup=False, link='auto'):
+    """Copy every file below source_dir into flat_dir; returns the run's counts.
+
+    With dedup, files sharing a name all get an output (see output_names),
+    and each distinct content is written once: other outputs with the same
+    SHA-1 are hard links to it (or reflinks/copies, see LINK_MODES).
+    """
+    script_path, current_dir, flat_dir = prepare_directories(source_dir, flat_dir)
+
+    manifest_path = os.path.join(flat_dir, MANIFEST_NAME)
+    previous = {} if full else load_manifest(manifest_path)
+    patterns = load_ignore_patterns(current_dir, ignore)
+    sources = scan_sources(current_dir, flat_dir, patterns, skip_paths={script_path})
+    names, collisions = output_names(sources, disambiguate=dedup)
+    placer = Placer(flat_dir, link if dedup else 'copy')
+
+    # Keep track of stats
+    stats = new_stats(len(sources), collisions)
+    files = sync_outputs(current_dir, flat_dir, names, previous, placer, stats, jobs, dedup, verbose)
+
+    if files != previous or not os.path.exists(manifest_path):
+        save_manifest(manifest_path, files)
+
+    stats['bytes'] = sum(record['size'] for record in files.values())
+    stats['unique_bytes'] = sum({record['sha1']: record['size'] for record in files.values()}.values())
+
     # Print summary
     print("\nSummary:")
-    print(f"Total files found: {total_files}")
-    print(f"Files copied: {copied_files}")
-    print(f"Files skipped: {skipped_files}")
-    print(f"Errors encountered: {errors}")
+    print(f"Total files found: {stats['total']}")
+    print(f"Files copied: {stats['copied']}")
+    if dedup:
+        print(f"Files linked to identical content: {stats['linked']}")
+    print(f"Files unchanged: {stats['unchanged']}")
+    print(f"Stale files removed: {stats['removed']}")
+    if dedup:
+        print(f"Name collisions (renamed): {stats['collisions']}")
+        print(f"Content: {stats['bytes']} bytes, {stats['unique_bytes']} unique")
+    else:
+        print(f"Name collisions (last one kept): {stats['collisions']}")
+    print(f"Errors encountered: {stats['errors']}")
     print(f"All files have been copied to: {flat_dir}")
+    return stats
+
+def update_sources(sources, changed, current_dir, flat_dir, patterns, script_path):
+    """Apply a batch of changed absolute paths to sources (relative path -> stat result)"""
+    matcher = compile_patterns(patterns)
+    for path in changed:
+        relative_path = os.path.relpath(path, current_dir).replace(os.sep, '/')
+        if path == script_path or relative_path == '.' or relative_path.startswith('../'):
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is not None and stat.S_ISREG(st.st_mode):
+            if not is_ignored(relative_path.rsplit('/', 1)[-1], relative_path, matcher):
+                sources[relative_path] = st
+            continue
+        if sources.pop(relative_path, None) is not None:
+            continue
+        # A directory was created, moved or removed: forget what was below it
+        # and scan it again if it is still there
+        prefix = relative_path + '/'
+        for key in [key for key in sources if key.startswith(prefix)]:
+            del sources[key]
+        if st is not None and stat.S_ISDIR(st.st_mode):
+            sources.update(scan_sources(current_dir, flat_dir, patterns, skip_paths={script_path}, top=path))
+
+def watch_directory(source_dir=None, flat_dir=None, ignore=(), jobs=DEFAULT_JOBS, full=False, verbose=False,
+                    dedup=False, link='auto', mode='auto', debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL,
+                    stats_interval=DEFAULT_STATS_INTERVAL):
+    """Sync flat_dir once, then keep it in sync until interrupted.
+
+    A DirectoryWatcher reports changed paths (inotify, or polling where that
+    is not available). Bursts are coalesced for `debounce` seconds, and each
+    batch only updates the affected sources: the outputs to write and remove
+    come from the in-memory manifest, without walking the tree again. The
+    flat directory is never watched, so the script's own writes do not come
+    back as events. Every `stats_interval` seconds with activity, a line
+    reports events per second and the sync lag, from when the first change
+    of a batch was seen until its outputs are written (when polling, a
+    change can wait up to poll_interval before it is seen).
+    """
+    script_path, current_dir, flat_dir = prepare_directories(source_dir, flat_dir)
+    current_dir = os.path.abspath(current_dir)
+    flat_path = os.path.abspath(flat_dir)
+    manifest_path = os.path.join(flat_dir, MANIFEST_NAME)
+    placer = Placer(flat_dir, link if dedup else 'copy')
+    patterns = load_ignore_patterns(current_dir, ignore)
+    matcher = compile_patterns(patterns)
+    ignore_file = os.path.join(current_dir, IGNORE_FILE)
+    sources = {}
+    files = {} if full else load_manifest(manifest_path)
+    batches = queue.Queue()
+
+    def ignored(path):
+        if path == flat_path or path.startswith(flat_path + os.sep):
+            return True
+        relative_path = os.path.relpath(path, current_dir).replace(os.sep, '/')
+        return is_ignored(os.path.basename(path), relative_path, matcher)
+
+    def start_watcher():
+        def changed(paths):
+            batches.put((paths, watcher.batch_started))
+        watcher = DirectoryWatcher(current_dir, changed, mode=mode, poll_interval=poll_interval,
+                                   debounce=debounce, ignore=ignored)
+        watcher.start()
+        return watcher
+
+    def sync(changed):
+        nonlocal files
+        if changed is None:
+            sources.clear()
+            sources.update(scan_sources(current_dir, flat_dir, patterns, skip_paths={script_path}))
+        else:
+            update_sources(sources, changed, current_dir, flat_dir, patterns, script_path)
+        ordered = sorted(sources.items(), key=lambda source: walk_order(source[0]))
+        names, collisions = output_names(ordered, disambiguate=dedup)
+        stats = new_stats(len(sources), collisions)
+        previous, files = files, sync_outputs(current_dir, flat_dir, names, files, placer, stats, jobs, dedup,
+                                              verbose)
+        if files != previous or not os.path.exists(manifest_path):
+            save_manifest(manifest_path, files)
+        return stats
+
+    # Watch before the first sync, so nothing changed during it is missed
+    watcher = start_watcher()
+    stats = sync(None)
+    print(f"Synced {stats['total']} files into {flat_dir} ({stats['copied'] + stats['linked']} written, "
+          f"{stats['removed']} removed); watching {current_dir} with {watcher.mode}. Press Ctrl+C to stop.")
+
+    events_before = 0
+    window = {'started': time.monotonic(), 'events': 0, 'syncs': 0, 'lags': []}
+    try:
+        while True:
+            try:
+                paths, started = batches.get(timeout=stats_interval)
+            except queue.Empty:
+                paths = started = None
+            else:
+                # Fold in whatever else has queued up while the last batch was synced
+                while True:
+                    try:
+                        more, more_started = batches.get_nowait()
+                    except queue.Empty:
+                        break
+                    paths = None if paths is None or more is None else paths | more
+                    started = min(started, more_started)
+                if paths is not None and ignore_file in paths:
+                    # New ignore rules: rewatch with them and rescan everything
+                    patterns = load_ignore_patterns(current_dir, ignore)
+                    matcher = compile_patterns(patterns)
+                    events_before += watcher.events
+                    watcher.stop()
+                    watcher = start_watcher()
+                    paths = None
+                stats = sync(paths)
+                lag = time.monotonic() - started
+                window['syncs'] += 1
+                window['lags'].append(lag)
+                if verbose or stats['copied'] or stats['linked'] or stats['removed'] or stats['errors']:
+                    print(f"Synced {'all' if paths is None else len(paths)} changed paths in {lag * 1000:.0f} ms: "
+                          f"{stats['copied'] + stats['linked']} written, {stats['removed']} removed, "
+                          f"{stats['errors']} errors")
+
+            now = time.monotonic()
+            if now - window['started'] >= stats_interval:
+                events = events_before + watcher.events
+                if window['syncs']:
+                    lags = window['lags']
+                    print(f"Watch: {(events - window['events']) / (now - window['started']):.1f} events/s, "
+                          f"{window['syncs']} syncs, lag {sum(lags) / len(lags) * 1000:.0f} ms mean, "
+                          f"{max(lags) * 1000:.0f} ms max")
+                window = {'started': now, 'events': events, 'syncs': 0, 'lags': []}
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.stop()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', help='directory to flatten (default: the directory of this script)')
+    parser.add_argument('--target', help='flat directory (default: flat/ in the source directory)')
+    parser.add_argument('--ignore', action='append', default=[], metavar='PATTERN',
+                        help='glob of files or directories to skip; may be repeated')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS, help='files copied in parallel')
+    parser.add_argument('--full', action='store_true', help='ignore the manifest and copy every file')
+    parser.add_argument('--verbose', action='store_true', help='print every file copied or removed')
+    parser.add_argument('--dedup', action='store_true',
+                        help='store each distinct content once and keep every file whose name collides')
+    parser.add_argument('--link', choices=LINK_MODES, default='auto',
+                        help='how --dedup places outputs (default: reflink or copy, then hard links)')
+    parser.add_argument('--watch', action='store_true', help='keep the flat directory in sync until interrupted')
+    parser.add_argument('--watch-mode', choices=('auto', 'inotify', 'poll'), default='auto',
+                        help='how --watch notices changes (default: inotify where available, else polling)')
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE * 1000, metavar='MS',
+                        help='quiet time that ends a burst of changes (default: %(default).0f)')
+    parser.add_argument('--stats-interval', type=float, default=DEFAULT_STATS_INTERVAL, metavar='SECONDS',
+                        help='seconds between --watch stats lines (default: %(default).0f)')
+    args = parser.parse_args(argv)
+    if args.watch:
+        return watch_directory(args.source, args.target, args.ignore, args.jobs, args.full, args.verbose,
+                               args.dedup, args.link, args.watch_mode, args.debounce / 1000, stats_interval=args.stats_interval)
+    stats = flatten_directory(args.source, args.target, args.ignore, args.jobs, args.full, args.verbose,
+                              args.dedup, args.link)
+    return 1 if stats['errors'] else 0
 
 if __name__ == "__main__":
-    flatten_directory()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Gunicorn Configuration
+
+Production entry point for the portal. gunicorn reads this file by default
+when started from this directory:
+
+    gunicorn                              # sync preset on port 5000
+    GUNICORN_PRESET=gthread gunicorn
+
+The app is built by app.create_app() in the master before any worker is
+forked (preload_app), so the data manifest, the parsed markdown document,
+the search index and the compiled template are built once and shared
+copy-on-write by all workers.
+
+GUNICORN_PRESET selects the worker model:
+    sync      2 x cores + 1 single-threaded workers. Best throughput for
+              these short, CPU-bound requests behind a buffering proxy.
+    gthread   cores + 1 workers with 4 threads each. Keeps connections
+              alive and tolerates slow clients at a small cost per request.
+    threaded  One worker with 4 threads per core. Least memory, one copy of
+              every cache, but all requests share a single GIL.
+    asgi      One uvicorn worker per core running asgi.py. Bodies are sent
+              from an event loop, so hundreds of slow clients do not tie up
+              threads (needs uvicorn; ASGI_THREADS sizes each worker's pool).
+
+GUNICORN_WORKERS and GUNICORN_THREADS override the preset; GUNICORN_BIND
+(or PORT) sets the listening address.
+"""
+
+import gc
+import multiprocessing
+import os
+import tempfile
+
+CORES = multiprocessing.cpu_count()
+
+PRESETS = {
+    'sync': {'worker_class': 'sync', 'workers': 2 * CORES + 1, 'threads': 1},
+    'gthread': {'worker_class': 'gthread', 'workers': CORES + 1, 'threads': 4},
+    'threaded': {'worker_class': 'gthread', 'workers': 1, 'threads': 4 * CORES},
+    'asgi': {'worker_class': 'uvicorn.workers.UvicornWorker', 'workers': CORES, 'threads': 1,
+             'app': 'asgi:create_application()'},
+}
+
+preset = os.environ.get('GUNICORN_PRESET', 'sync')
+if preset not in PRESETS:
+    raise RuntimeError(f"Unknown GUNICORN_PRESET {preset!r}; expected one of {', '.join(PRESETS)}")
+
+wsgi_app = PRESETS[preset].get('app', 'app:create_app()')
+preload_app = True
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+worker_class = PRESETS[preset]['worker_class']
+workers = int(os.environ.get('GUNICORN_WORKERS', PRESETS[preset]['workers']))
+threads = int(os.environ.get('GUNICORN_THREADS', PRESETS[preset]['threads']))
+timeout = 30
+keepalive = 5
+
+# Settings app.py reads at import, which happens after this file is loaded.
+# All workers report /metrics through one directory, and several processes
+# must not rotate the same log file (rotate it externally instead).
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f"ai-first-metrics-{os.getpid()}"))
+os.environ.setdefault('LOG_MAX_BYTES', '0')
+
+def on_starting(server):
+    import metrics
+    metrics.clear_directory(os.environ['METRICS_DIR'])
+
+def when_ready(server):
+    server.log.info(f"Preset {preset}: {workers} x {worker_class} workers, {threads} threads each")
+
+def pre_fork(server, worker):
+    # Move everything built during preload out of the collector's reach, so
+    # garbage collection in a worker does not write to (and copy) shared pages
+    gc.freeze()
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(os.environ['METRICS_DIR'], worker.pid)
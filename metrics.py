@@ -0,0 +1,350 @@
+"""
+Metrics
+
+Counters, gauges and histograms rendered in the Prometheus text format,
+with no dependencies beyond the standard library.
+
+In a single process the values live in a dict. When a directory is given
+(e.g. under gunicorn with several workers), each process writes its values
+to its own memory-mapped file in that directory, created when the process
+first records a value, and render() adds up the
+files of all processes, so any worker can answer a scrape for the whole
+server. Counters and histograms of exited workers are kept, so totals
+never go backwards; gauges only count processes that are still alive.
+The directory should be emptied when the server starts (clear_directory).
+"""
+
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+INITIAL_FILE_SIZE = 64 * 1024
+USED = struct.Struct('q')
+KEY_LENGTH = struct.Struct('i')
+VALUE = struct.Struct('d')
+
+def sample_key(name, labelnames, labelvalues):
+    return json.dumps([name, [[label, str(value)] for label, value in zip(labelnames, labelvalues)]])
+
+class DictValues:
+    """Values of this process only, kept in memory"""
+
+    def __init__(self):
+        self._values = {}
+
+    def add(self, key, amount):
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        self._values[key] = value
+
+    def items(self):
+        return list(self._values.items())
+
+    def close(self):
+        pass
+
+class MmapValues:
+    """Values of this process in a memory-mapped file other processes can read.
+
+    Layout: an 8-byte count of used bytes, then records of a 4-byte key
+    length, the UTF-8 key padded to 8 bytes, and an 8-byte double. Only the
+    owning process writes; the used count is bumped after a record is
+    complete, so readers never see half-written records.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(INITIAL_FILE_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._positions = {}
+        self._used = USED.unpack_from(self._map, 0)[0] or USED.size
+        for key, value, position in read_records(self._map, self._used):
+            self._positions[key] = position
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is None:
+            encoded = key.encode('utf-8')
+            padded = len(encoded) + (-(KEY_LENGTH.size + len(encoded)) % 8)
+            size = KEY_LENGTH.size + padded + VALUE.size
+            while self._used + size > self._capacity:
+                self._capacity *= 2
+                self._file.truncate(self._capacity)
+                self._map.close()
+                self._map = mmap.mmap(self._file.fileno(), self._capacity)
+            KEY_LENGTH.pack_into(self._map, self._used, len(encoded))
+            self._map[self._used + KEY_LENGTH.size:self._used + KEY_LENGTH.size + len(encoded)] = encoded
+            position = self._used + KEY_LENGTH.size + padded
+            VALUE.pack_into(self._map, position, 0.0)
+            self._used += size
+            USED.pack_into(self._map, 0, self._used)
+            self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self._position(key)
+        VALUE.pack_into(self._map, position, VALUE.unpack_from(self._map, position)[0] + amount)
+
+    def set(self, key, value):
+        VALUE.pack_into(self._map, self._position(key), value)
+
+    def items(self):
+        return [(key, value) for key, value, _ in read_records(self._map, self._used)]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+def read_records(data, used):
+    """Yield (key, value, value offset) for the records in a values buffer"""
+    position = USED.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(data, position)[0]
+        key_start = position + KEY_LENGTH.size
+        key = bytes(data[key_start:key_start + length]).decode('utf-8')
+        value_position = key_start + length + (-(KEY_LENGTH.size + length) % 8)
+        yield key, VALUE.unpack_from(data, value_position)[0], value_position
+        position = value_position + VALUE.size
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < USED.size:
+        return []
+    return [(key, value) for key, value, _ in read_records(data, min(USED.unpack_from(data, 0)[0], len(data)))]
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def clear_directory(directory):
+    """Remove the value files of a previous run; call once before workers start"""
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        os.remove(path)
+
+def mark_process_dead(directory, pid):
+    """Drop the gauges of a worker that exited (its counters are kept)"""
+    path = os.path.join(directory, f"gauge_{pid}.db")
+    if os.path.exists(path):
+        os.remove(path)
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+
+    def samples(self):
+        """Sample names this metric renders, in output order"""
+        return (self.name,)
+
+    def _key(self, labelvalues):
+        key = self._keys.get(labelvalues)
+        if key is None:
+            key = self._keys[labelvalues] = sample_key(self.name, self.labelnames, labelvalues)
+        return key
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labelvalues=(), amount=1.0):
+        self.registry.add('counter', self._key(labelvalues), amount)
+
+    def set_total(self, labelvalues, value):
+        """Mirror a running total kept elsewhere in this process (e.g. cache hits)"""
+        self.registry.set('counter', self._key(labelvalues), value)
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, labelvalues=(), amount=1.0):
+        self.registry.add('gauge', self._key(labelvalues), amount)
+
+    def dec(self, labelvalues=(), amount=1.0):
+        self.registry.add('gauge', self._key(labelvalues), -amount)
+
+    def set(self, labelvalues, value):
+        self.registry.set('gauge', self._key(labelvalues), value)
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def samples(self):
+        return (f"{self.name}_bucket", f"{self.name}_sum", f"{self.name}_count")
+
+    def _key(self, labelvalues):
+        keys = self._keys.get(labelvalues)
+        if keys is None:
+            labelnames = self.labelnames + ('le',)
+            keys = self._keys[labelvalues] = (
+                [sample_key(f"{self.name}_bucket", labelnames, labelvalues + (format_value(bound),))
+                 for bound in self.buckets],
+                sample_key(f"{self.name}_sum", self.labelnames, labelvalues),
+                sample_key(f"{self.name}_count", self.labelnames, labelvalues)
+            )
+        return keys
+
+    def observe(self, labelvalues, value):
+        buckets, sum_key, count_key = self._key(labelvalues)
+        with self.registry.lock:
+            # Buckets are stored cumulatively, as they are exposed
+            for bound, key in zip(self.buckets, buckets):
+                if value <= bound:
+                    self.registry.values['counter'].add(key, 1.0)
+            self.registry.values['counter'].add(sum_key, value)
+            self.registry.values['counter'].add(count_key, 1.0)
+
+class Registry:
+    """A set of metrics and the storage for their values"""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.metrics = []
+        self._values = None
+        self._parsed = {}
+        if hasattr(os, 'register_at_fork'):
+            # A forked worker must not write into its parent's files; it
+            # opens its own on first use
+            os.register_at_fork(after_in_child=self._forget)
+
+    @property
+    def values(self):
+        """This process's value stores, opened on first use"""
+        with self.lock:
+            if self._values is None:
+                self._values = self._open()
+            return self._values
+
+    def _open(self):
+        if self.directory is None:
+            return {'counter': DictValues(), 'gauge': DictValues()}
+        pid = os.getpid()
+        os.makedirs(self.directory, exist_ok=True)
+        return {
+            kind: MmapValues(os.path.join(self.directory, f"{kind}_{pid}.db"))
+            for kind in ('counter', 'gauge')
+        }
+
+    def _forget(self):
+        self.lock = threading.RLock()
+        self._values = None
+
+    def set_directory(self, directory):
+        """Store values in directory (None: in memory) from now on"""
+        with self.lock:
+            if directory == self.directory:
+                return
+            if self._values is not None:
+                for store in self._values.values():
+                    store.close()
+                self._values = None
+            self.directory = directory
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add(self, kind, key, amount):
+        with self.lock:
+            self.values[kind].add(key, amount)
+
+    def set(self, kind, key, value):
+        with self.lock:
+            self.values[kind].set(key, value)
+
+    def collect(self):
+        """Sum the values of every process, keyed by sample key"""
+        totals = {}
+        if self.directory is None:
+            with self.lock:
+                sources = [self.values['counter'].items(), self.values['gauge'].items()]
+        else:
+            sources = []
+            for path in glob.glob(os.path.join(self.directory, '*.db')):
+                kind, _, pid = os.path.basename(path)[:-3].partition('_')
+                if kind == 'gauge' and pid.isdigit() and not pid_alive(int(pid)):
+                    continue
+                try:
+                    sources.append(read_file(path))
+                except (OSError, ValueError, struct.error):
+                    continue
+        for items in sources:
+            for key, value in items:
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self, totals=None):
+        """The Prometheus text exposition of every registered metric"""
+        if totals is None:
+            totals = self.collect()
+        by_name = {}
+        for key, value in totals.items():
+            parsed = self._parsed.get(key)
+            if parsed is None:
+                # Keys are few and long-lived; parse each one once
+                name, labels = json.loads(key)
+                parsed = self._parsed[key] = (name, sample_order(labels), f"{name}{format_labels(labels)} ")
+            by_name.setdefault(parsed[0], []).append((parsed[1], parsed[2], value))
+
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for sample in metric.samples():
+                for _, prefix, value in sorted(by_name.get(sample, ()), key=lambda item: item[0]):
+                    lines.append(prefix + format_value(value))
+        return '\n'.join(lines) + '\n'
+
+def sample_order(labels):
+    # Keep histogram buckets in numeric order within each label set
+    other = [pair for pair in labels if pair[0] != 'le']
+    bound = [float(value) for label, value in labels if label == 'le']
+    return other, bound
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{label}="{escape_label(value)}"' for label, value in labels) + '}'
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return f"{int(value)}.0"
+    return repr(value)
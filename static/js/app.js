@@ -173,7 +173,9 @@ function loadTabContent(tabId) {
 // Load markdown content
 async function loadMarkdown() {
     try {
-        const response = await fetch('/api/markdown');
+        // In server render mode the API returns finished HTML
+        const url = window.markdownRenderMode === 'server' ? '/api/markdown?format=html' : '/api/markdown';
+        const response = await fetch(url);
         const data = await response.json();
         
         if (data.error) {
@@ -182,26 +184,42 @@ async function loadMarkdown() {
         }
         
         appData.markdown = data.content;
+        appData.markdownFormat = data.format || 'markdown';
         appData.headings = data.headings;
     } catch (error) {
         console.error('Error fetching markdown:', error);
     }
 }
 
+// Fetch every workflow diagram in one request. The promise is shared with
+// unified-mermaid.js so the sources are only downloaded once per page.
+window.loadDiagramBundle = function() {
+    if (!window.diagramBundlePromise) {
+        window.diagramBundlePromise = fetch('/api/diagrams/bundle')
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Failed to load diagram bundle (${response.status})`);
+                }
+                return response.json();
+            })
+            .catch(error => {
+                // Allow a later retry
+                window.diagramBundlePromise = null;
+                throw error;
+            });
+    }
+    return window.diagramBundlePromise;
+};
+
 // Load mermaid diagrams
 async function loadDiagrams() {
     try {
-        // Load traditional workflow
-        const traditionalResponse = await fetch('/api/files/traditional-workflow.txt');
-        appData.diagrams.traditional = await traditionalResponse.text();
-        
-        // Load AI-assisted workflow
-        const aiAssistedResponse = await fetch('/api/files/ai-assisted-workflow.txt');
-        appData.diagrams.aiAssisted = await aiAssistedResponse.text();
+        const bundle = await window.loadDiagramBundle();
+        const source = name => bundle.diagrams[name] ? bundle.diagrams[name].content : null;
         
-        // Load AI-first workflow
-        const aiFirstResponse = await fetch('/api/files/ai-first-workflow.txt');
-        appData.diagrams.aiFirst = await aiFirstResponse.text();
+        appData.diagrams.traditional = source('traditional-workflow');
+        appData.diagrams.aiAssisted = source('ai-assisted-workflow');
+        appData.diagrams.aiFirst = source('ai-first-workflow');
     } catch (error) {
         console.error('Error loading diagrams:', error);
     }
@@ -243,8 +261,10 @@ function initOverviewTab() {
     // Add markdown content
     const markdownContent = document.getElementById('markdown-content');
     if (markdownContent && appData.markdown) {
-        // Instead of direct assignment, use the enhanced renderer
-        markdownContent.innerHTML = renderMarkdown(appData.markdown);
+        // Server-rendered HTML is used as is; otherwise use the enhanced renderer
+        markdownContent.innerHTML = appData.markdownFormat === 'html'
+            ? appData.markdown
+            : renderMarkdown(appData.markdown);
         
         // Add click handlers for any links to tabs
         document.querySelectorAll('#markdown-content a[href^="#"]').forEach(anchor => {
@@ -58,6 +58,29 @@ document.addEventListener('DOMContentLoaded', function() {
     if (aiFirst) renderMermaidFromFile('ai-first-workflow', 'ai-first-workflow.txt');
   };
   
+  // Get a diagram's source from the bundle app.js loads, falling back to
+  // fetching the single file
+  function loadDiagramSource(fileName) {
+    const baseName = fileName.replace(/\.(mermaid|txt)$/, '');
+    const bundled = typeof window.loadDiagramBundle === 'function'
+      ? window.loadDiagramBundle()
+          .then(bundle => bundle.diagrams[baseName] ? bundle.diagrams[baseName].content : null)
+          .catch(() => null)
+      : Promise.resolve(null);
+    
+    return bundled.then(content => {
+      if (content !== null) {
+        return content;
+      }
+      return fetch(`/api/files/${fileName}`).then(response => {
+        if (!response.ok) {
+          throw new Error(`Failed to load diagram file (${response.status}): ${fileName}`);
+        }
+        return response.text();
+      });
+    });
+  }
+  
   // Render a Mermaid diagram from a file
   function renderMermaidFromFile(elementId, fileName) {
     console.log(`Rendering Mermaid diagram from file: ${fileName} into element: ${elementId}`);
@@ -70,14 +93,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Show loading state
     element.innerHTML = '<div class="text-center p-4">Loading diagram...</div>';
     
-    // Fetch the diagram content from the file
-    fetch(`/api/files/${fileName}`)
-      .then(response => {
-        if (!response.ok) {
-          throw new Error(`Failed to load diagram file (${response.status}): ${fileName}`);
-        }
-        return response.text();
-      })
+    // Fetch the diagram content, from the shared bundle when possible
+    loadDiagramSource(fileName)
       .then(content => {
         // Once we have the content, render it
         renderMermaidContent(elementId, content);